@@ -0,0 +1,170 @@
+import sys, os, time, random, struct
+from concurrent.futures import ThreadPoolExecutor
+import bigfile
+import drm
+
+# usage: python bench.py <benchmark> [args...]
+
+def timeit(fn, repeat=5):
+	best = None
+	for i in range(repeat):
+		t = time.perf_counter()
+		r = fn()
+		t = time.perf_counter() - t
+		best = t if best is None else min(best, t)
+	return best, r
+
+def bench_crc32r(filelists):
+	# crc32r before it used bytes.translate, kept as the reference
+	flipbyte = bigfile.flipbyte
+	def flipword_reference(w):
+		return (
+			(flipbyte[(w>>24)&0xff]    ) |
+			(flipbyte[(w>>16)&0xff]<< 8) |
+			(flipbyte[(w>> 8)&0xff]<<16) |
+			(flipbyte[(w    )&0xff]<<24))
+	def crc32r_reference(d):
+		return flipword_reference(bigfile.crc32(bytes(flipbyte[v] for v in d)))
+
+	names = []
+	for filelist in filelists:
+		names.extend(bigfile.read_filelist(filelist))
+	print(len(names), "paths")
+
+	t_ref, ref = timeit(lambda: [crc32r_reference(name) for name in names], 1)
+	t_one, one = timeit(lambda: [bigfile.crc32r(name) for name in names])
+	t_many, many = timeit(lambda: bigfile.crc32r_many(names))
+
+	assert ref == one, "crc32r differs from the reference"
+	assert ref == list(many), "crc32r_many differs from the reference"
+
+	print("reference    {:8.2f} ms".format(t_ref * 1000))
+	print("crc32r       {:8.2f} ms".format(t_one * 1000))
+	print("crc32r_many  {:8.2f} ms".format(t_many * 1000))
+
+def bench_threads(args):
+	# read every entry of an archive sequentially, then hammer the same
+	# BigFile from a thread pool in random order and compare the results
+	path = args[0]
+	workers = int(args[1]) if len(args) > 1 else 16
+	rounds = 4
+
+	for use_mmap in (False, True):
+		big = bigfile.BigFile(path, use_mmap=use_mmap)
+		rows = list(range(len(big.hashes)))
+		t_seq, expected = timeit(lambda: [bytes(big.row_slice(i)) for i in rows], 1)
+
+		jobs = rows * rounds
+		random.shuffle(jobs)
+		with ThreadPoolExecutor(workers) as pool:
+			t_par, results = timeit(lambda: list(pool.map(lambda i: bytes(big.row_slice(i)), jobs)), 1)
+
+		for i, data in zip(jobs, results):
+			assert data == expected[i], "entry {} read back differently".format(i)
+
+		print("mmap={} {} entries, sequential {:.2f}s, {} threads x {} rounds {:.2f}s".format(
+			use_mmap, len(rows), t_seq, workers, rounds, t_par))
+
+def bench_cdrm(fnames):
+	# serial vs threaded CDRM decompression on the largest of the given
+	# files, eg. bench.py cdrm pc-w/*.drm
+	workers = os.cpu_count()
+	fnames = sorted(fnames, key=os.path.getsize, reverse=True)[:5]
+	for fname in fnames:
+		with open(fname, "rb") as f:
+			data = f.read()
+		if data[0:4] != b"CDRM":
+			continue
+		t_serial, serial = timeit(lambda: drm.cdrm(data))
+		t_threads, threaded = timeit(lambda: drm.cdrm(data, workers=workers))
+		assert serial == threaded, fname
+		print("{}: {} blocks, {:.1f} MB, serial {:.1f} ms, {} threads {:.1f} ms".format(
+			fname, len(drm.cdrm_blocks(data)), len(serial) / 1e6,
+			t_serial * 1000, workers, t_threads * 1000))
+
+def bench_write(fnames):
+	# round trips the relocations of every section through read_reloc(check=True),
+	# then times writing the largest of the given drms, eg. bench.py write pc-w/*unit*.drm
+	def write_reloc_reference(reloc):
+		# write_reloc before it packed whole kinds at once
+		r = {0: b"", 1: b"", 2: b"", 4: b""}
+		for i in reloc.rows():
+			patchsite, kind, target, targetty, targetoff = (reloc.patchsites[i],
+				reloc.kinds[i] & ~drm.Relocations.missing, reloc.targets[i], reloc.types[i], reloc.offsets[i])
+			if kind == 0:
+				r[0] += struct.pack("<Q", patchsite | (targetoff << 32))
+			elif kind == 1:
+				r[1] += struct.pack("<Q", target | (patchsite << 12) | (targetoff << 38))
+			else:
+				r[kind] += struct.pack("<I", (patchsite >> 2) | (targetty << 25))
+		return struct.pack("<IIIII", len(r[0]) // 8, len(r[1]) // 8, len(r[2]) // 4, 0, len(r[4]) // 4) + \
+			r[0] + r[1] + r[2] + r[4]
+
+	checked = 0
+	for fname in fnames:
+		db = drm.DB(os.path.dirname(fname) or ".")
+		sections, root, extra = db.load_internal(os.path.basename(fname))
+		for section in sections:
+			drm.read_reloc(section.fixup, section.ty_id_to_index, section.index, section.view, check=True)
+			checked += 1
+	print(checked, "sections round trip")
+
+	fname = max(fnames, key=os.path.getsize)
+	db = drm.DB(os.path.dirname(fname) or ".")
+	sections, root, extra = db.load_internal(os.path.basename(fname))
+	relocs = [section.fixupinfo for section in sections]
+	t_ref, ref = timeit(lambda: [write_reloc_reference(r) if r else b"" for r in relocs])
+	t_new, new = timeit(lambda: [drm.write_reloc(r, i) for i, r in enumerate(relocs)])
+	t_write, data = timeit(lambda: extra.write(sections, root))
+	assert ref == new, "write_reloc differs from the reference"
+
+	print("{}: {} sections, {} relocations".format(fname, len(sections), sum(len(r) for r in relocs)))
+	print("write_reloc reference {:8.2f} ms".format(t_ref * 1000))
+	print("write_reloc           {:8.2f} ms".format(t_new * 1000))
+	print("write                 {:8.2f} ms".format(t_write * 1000))
+
+def bench_alloc(args):
+	# peak traced memory, allocated blocks and peak rss of either a whole
+	# script (bench.py alloc decompiler_html.py) or of following every
+	# relocation of the given drms with References (bench.py alloc pc-w/*.drm)
+	import tracemalloc, resource, runpy, gc
+	tracemalloc.start()
+	t = time.perf_counter()
+	if args[0].endswith(".py"):
+		sys.argv = args
+		runpy.run_path(args[0], run_name="__main__")
+	else:
+		refs = []
+		for fname in args:
+			db = drm.DB(os.path.dirname(fname) or ".")
+			sections, root, extra = db.load_internal(os.path.basename(fname))
+			for section in sections:
+				ref = drm.Reference(sections, section)
+				for patchsite in section.fixupinfo:
+					refs.append(ref.deref(patchsite))
+					refs.append(ref.add(patchsite))
+		print(len(refs), "references")
+	t = time.perf_counter() - t
+	snapshot = tracemalloc.take_snapshot()
+	current, peak = tracemalloc.get_traced_memory()
+	blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+	tracemalloc.stop()
+
+	section = drm.Section()
+	section_size = sys.getsizeof(section) + sys.getsizeof(getattr(section, "__dict__", None) or ())
+	print("Section {} bytes, Reference {} bytes".format(
+		section_size, sys.getsizeof(drm.Reference(None, section))))
+	print("{:.2f}s, {} live blocks, {:.1f} MB current, {:.1f} MB peak traced, {:.1f} MB peak rss".format(
+		t, blocks, current / 1e6, peak / 1e6,
+		resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+benchmarks = {
+	"crc32r": bench_crc32r, # bench.py crc32r data/*/files/*.filelist
+	"threads": bench_threads, # bench.py threads BIGFILE.000 [workers]
+	"cdrm": bench_cdrm, # bench.py cdrm pc-w/*.drm
+	"write": bench_write, # bench.py write pc-w/*unit*.drm
+	"alloc": bench_alloc, # bench.py alloc decompiler_html.py, or bench.py alloc pc-w/*.drm
+}
+
+if __name__ == '__main__':
+	benchmarks[sys.argv[1]](sys.argv[2:])
@@ -1,4 +1,8 @@
-import struct, os, os.path
+import struct, os, os.path, mmap, array, sys, glob, time, threading
+from concurrent.futures import ThreadPoolExecutor
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from collections.abc import Mapping
 from zlib import crc32
 
 flipbyte = bytes([
@@ -21,58 +25,375 @@ flipbyte = bytes([
 ])
 
 def flipword(w):
-	return (
-		(flipbyte[(w>>24)&0xff]    ) |
-		(flipbyte[(w>>16)&0xff]<< 8) |
-		(flipbyte[(w>> 8)&0xff]<<16) |
-		(flipbyte[(w    )&0xff]<<24))
+	return int.from_bytes(w.to_bytes(4, "little").translate(flipbyte), "big")
 
 def crc32r(d):
-	return flipword(crc32(bytes(flipbyte[v] for v in d)))
+	return flipword(crc32(d.translate(flipbyte)))
+
+def crc32r_many(paths):
+	# hash a whole list of paths, returns an array('I') in the same order
+	#
+	# the output words are bit-reversed in bulk: flipping a word is
+	# flipping each of its bytes and then swapping their order
+	crcs = array.array("I", [crc32(path.translate(flipbyte)) for path in paths])
+	out = array.array("I", crcs.tobytes().translate(flipbyte))
+	out.byteswap()
+	return out
+
+def read_filelist(path):
+	# bigfile.filelist and friends: one path per line (CRLF), ';' comments
+	with open(path, "rb") as f:
+		lines = f.read().splitlines()
+	return [line for line in lines if line and not line.startswith(b";")]
 
 uint32 = struct.Struct("<L").unpack_from
 uint32x4 = struct.Struct("<LLLL").unpack_from
 
+# archives are split into BIGFILE.000, BIGFILE.001, ... at this boundary
+part_size = 0x7FF00000
+
+# sidecar index next to BIGFILE.000, see BigFile.load_index_cache
+index_cache_magic = b"BIDX"
+index_cache_version = 1
+index_cache_header = struct.Struct("<4sIIIQQ")
+
+def uint32_array(b=b""):
+	a = array.array("I")
+	assert a.itemsize == 4
+	a.frombytes(b)
+	if sys.byteorder == "big":
+		a.byteswap()
+	return a
+
+def uint32_array_bytes(a):
+	if sys.byteorder == "big":
+		a = array.array("I", a)
+		a.byteswap()
+	return a.tobytes()
+
 class BigFile:
-	def __init__(self, path, filelist = None):
+	def __init__(self, path, filelist = None, use_mmap = False, index_cache = True, max_open_parts = 8):
+		# with use_mmap every part is mapped once and get() returns
+		# memoryviews into the mapping instead of fresh bytes objects
+		#
+		# parts are opened on first access, and at most max_open_parts
+		# handles are kept open (mappings stay alive, they don't need one)
 		self.path = path
 		self.filelist = filelist or []
+		self.use_mmap = use_mmap
+		self.index_cache = index_cache
 		self.read_index()
-		self.files = []
-		path = path[:-3]
-		for i in range(1000):
-			n = "{}{:03d}".format(path, i)
-			try:
-				f = open(n, "rb")
-			except:
-				break
-			print("opened", n)
-			self.files.append(f)
+		self.max_open_parts = max_open_parts
+		self.lock = threading.Lock()
+		self.open_parts = OrderedDict() # {filenr: file}, least recently used first
+		self.part_users = {} # {filenr: number of reads in progress}
+		self.maps = {} # {filenr: memoryview}
+		self.local = threading.local()
+
+	def part_path(self, filenr):
+		return "{}{:03d}".format(self.path[:-3], filenr)
+
+	def acquire_part(self, filenr):
+		with self.lock:
+			f = self.open_parts.get(filenr)
+			if f is None:
+				f = self.open_parts[filenr] = open(self.part_path(filenr), "rb")
+			self.open_parts.move_to_end(filenr)
+			self.part_users[filenr] = self.part_users.get(filenr, 0) + 1
+
+			# close the least recently used handles that nobody is reading from
+			excess = len(self.open_parts) - self.max_open_parts
+			for n in list(self.open_parts):
+				if excess <= 0:
+					break
+				if not self.part_users.get(n):
+					self.open_parts.pop(n).close()
+					excess -= 1
+			return f
+
+	def release_part(self, filenr):
+		with self.lock:
+			self.part_users[filenr] -= 1
+
+	def part_map(self, filenr):
+		m = self.maps.get(filenr)
+		if m is None:
+			with self.lock:
+				m = self.maps.get(filenr)
+				if m is None:
+					with open(self.part_path(filenr), "rb") as f:
+						m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+					m = self.maps[filenr] = memoryview(m)
+		return m
+
+	def close(self):
+		# mappings that views from get() still point into can't be closed,
+		# they go away with the last of those views instead
+		with self.lock:
+			for f in self.open_parts.values():
+				f.close()
+			self.open_parts.clear()
+			for view in self.maps.values():
+				m = view.obj
+				view.release()
+				try:
+					m.close()
+				except BufferError:
+					pass
+			self.maps.clear()
 
 	def read_index(self):
-		self.entries = {}
+		# the index is kept as four parallel uint32 columns sorted by hash:
+		# self.hashes, self.offsets (in 2048 byte units), self.sizes, self.languages
+		st = os.stat(self.path)
+		if self.index_cache and self.load_index_cache(st):
+			return
+
 		with open(self.path, "rb") as f:
 			f.seek(68)
 			count = uint32(f.read(4))[0]
-			hashes_b = f.read(count * 4)
-			entries_b = f.read(count * 16)
-			for i in range(count):
-				file_hash, = uint32(hashes_b, 4*i)
-				file_size, file_offset, file_language, zero = uint32x4(entries_b, 16*i)
-				assert zero == 0
-				self.entries.setdefault(file_hash, []).append((file_offset * 2048, file_size, file_language))
+			hashes = uint32_array(f.read(count * 4))
+			entries = uint32_array(f.read(count * 16))
+
+		# the fourth word of each entry is the compressed size (or zero)
+		sizes = entries[0::4]
+		offsets = entries[1::4]
+		languages = entries[2::4]
+
+		if any(a > b for a, b in zip(hashes, hashes[1:])):
+			order = sorted(range(count), key=hashes.__getitem__)
+			hashes = array.array("I", (hashes[i] for i in order))
+			sizes = array.array("I", (sizes[i] for i in order))
+			offsets = array.array("I", (offsets[i] for i in order))
+			languages = array.array("I", (languages[i] for i in order))
+
+		self.hashes = hashes
+		self.offsets = offsets
+		self.sizes = sizes
+		self.languages = languages
+
+		if self.index_cache:
+			self.save_index_cache(st)
+
+	def index_cache_path(self):
+		return self.path + ".idx"
+
+	def load_index_cache(self, st):
+		try:
+			with open(self.index_cache_path(), "rb") as f:
+				data = f.read()
+		except OSError:
+			return False
+
+		if len(data) < index_cache_header.size:
+			return False
+		magic, version, count, _, size, mtime = index_cache_header.unpack_from(data)
+		if magic != index_cache_magic or version != index_cache_version:
+			return False
+		if size != st.st_size or mtime != st.st_mtime_ns:
+			return False
+		if len(data) != index_cache_header.size + count * 16:
+			return False
+
+		o = index_cache_header.size
+		self.hashes    = uint32_array(data[o            :o +   count*4])
+		self.offsets   = uint32_array(data[o + count*4  :o + 2*count*4])
+		self.sizes     = uint32_array(data[o + 2*count*4:o + 3*count*4])
+		self.languages = uint32_array(data[o + 3*count*4:o + 4*count*4])
+		return True
+
+	def save_index_cache(self, st):
+		header = index_cache_header.pack(
+			index_cache_magic,
+			index_cache_version,
+			len(self.hashes),
+			0,
+			st.st_size,
+			st.st_mtime_ns)
+		path = self.index_cache_path()
+		# per process, processes opening the archive at the same time would
+		# otherwise write into each other's temp file
+		tmppath = "{}.{}.tmp".format(path, os.getpid())
+		try:
+			with open(tmppath, "wb") as f:
+				f.write(header)
+				f.write(uint32_array_bytes(self.hashes))
+				f.write(uint32_array_bytes(self.offsets))
+				f.write(uint32_array_bytes(self.sizes))
+				f.write(uint32_array_bytes(self.languages))
+			os.replace(tmppath, path)
+		except OSError:
+			# read-only install directories are fine, just don't cache
+			try:
+				os.remove(tmppath)
+			except OSError:
+				pass
+
+	@property
+	def entries(self):
+		return BigFileEntries(self)
+
+	def find(self, file_hash, lo=0):
+		# index rows [lo, hi) carrying this hash
+		lo = bisect_left(self.hashes, file_hash, lo)
+		hi = bisect_right(self.hashes, file_hash, lo)
+		return lo, hi
+
+	def lookup_hash(self, file_hash, language_mask, language_ref, lo=0):
+		lo, hi = self.find(file_hash, lo)
+		languages = self.languages
+		for i in range(lo, hi):
+			if languages[i] & language_mask == language_ref:
+				return i
+		return None
+
+	def lookup(self, path, language_mask, language_ref):
+		return self.lookup_hash(crc32r(path), language_mask, language_ref)
+
+	def lookup_many(self, paths, language_mask, language_ref):
+		# index rows for many paths at once (None where missing); the hashes
+		# are visited in sorted order so each search starts where the
+		# previous one ended
+		file_hashes = crc32r_many(paths)
+		rows = [None] * len(file_hashes)
+		lo = 0
+		for j in sorted(range(len(file_hashes)), key=file_hashes.__getitem__):
+			lo = bisect_left(self.hashes, file_hashes[j], lo)
+			rows[j] = self.lookup_hash(file_hashes[j], language_mask, language_ref, lo)
+		return rows
+
+	def variants(self, path):
+		# index rows of all language versions of path; rows with the same
+		# hash are adjacent in the index so this is a single bisect
+		return range(*self.find(crc32r(path)))
+
+	def get_all_variants(self, path):
+		# [(language, data)] for every language version of path
+		rows = sorted(self.variants(path), key=self.offsets.__getitem__)
+		data = {i: self.row_slice(i) for i in rows}
+		return [(self.languages[i], data[i]) for i in self.variants(path)]
+
+	def get_many(self, paths, language_mask, language_ref):
+		# get() for every path, returned in the same order as paths, but read
+		# in the order the entries are stored in the archive
+		rows = self.lookup_many(paths, language_mask, language_ref)
+		results = [None] * len(rows)
+		for j, data in self.iter_rows(rows):
+			results[j] = data
+		return results
+
+	def iter_many(self, paths, language_mask, language_ref, max_read=16<<20):
+		# yields (path, data) in archive order rather than in the order of
+		# paths. entries that follow each other in the same part are fetched
+		# with one read of up to max_read bytes. paths that aren't in the
+		# archive come last with None as data
+		paths = list(paths)
+		rows = self.lookup_many(paths, language_mask, language_ref)
+		for j, data in self.iter_rows(rows, max_read):
+			yield paths[j], data
+		for path, i in zip(paths, rows):
+			if i is None:
+				yield path, None
+
+	def iter_rows(self, rows, max_read=16<<20):
+		# yields (j, data) for each rows[j] that isn't None, see iter_many
+		order = [j for j, i in enumerate(rows) if i is not None]
+		order.sort(key=lambda j: self.offsets[rows[j]])
+
+		run = [] # [(j, offset, size)] for the read being assembled
+		run_start = run_end = 0
+		for j in order + [None]:
+			if j is not None:
+				i = rows[j]
+				offset = self.offsets[i] * 2048
+				size = self.sizes[i]
+				end = offset + size
+				if run and offset <= (run_end + 2047) & ~2047 and \
+					offset // part_size == run_start // part_size and \
+					max(end, run_end) - run_start <= max_read:
+					run.append((j, offset, size))
+					run_end = max(run_end, end)
+					continue
+
+			if run:
+				data = self.get_slice(run_start, run_end - run_start)
+				for k, k_offset, k_size in run:
+					yield k, data[k_offset - run_start:k_offset - run_start + k_size]
+
+			if j is not None:
+				run = [(j, offset, size)]
+				run_start, run_end = offset, end
+
+	def row_slice(self, i):
+		return self.get_slice(self.offsets[i] * 2048, self.sizes[i])
 
 	def get_slice(self, offset, size):
-		filenr = offset // 0x7FF00000
-		f = self.files[filenr]
-		f.seek(offset % 0x7FF00000)
-		return f.read(size)
+		filenr = offset // part_size
+		if self.use_mmap:
+			start = offset % part_size
+			return self.part_map(filenr)[start:start+size]
+		return self.read_at(filenr, offset % part_size, size)
+
+	def read_at(self, filenr, position, size):
+		# safe to call from many threads at once: there is no shared file
+		# position, either thanks to pread or to per-thread file handles
+		if not hasattr(os, "pread"):
+			files = self.local.__dict__.setdefault("files", OrderedDict())
+			f = files.pop(filenr, None) or open(self.part_path(filenr), "rb")
+			files[filenr] = f
+			while len(files) > self.max_open_parts:
+				files.popitem(last=False)[1].close()
+			f.seek(position)
+			return f.read(size)
+
+		fd = self.acquire_part(filenr).fileno()
+		try:
+			data = os.pread(fd, size, position)
+			if len(data) == size:
+				return data
+			# short read, continue until size bytes or the end of the file
+			parts = [data]
+			got = len(data)
+			while data and got < size:
+				data = os.pread(fd, size - got, position + got)
+				parts.append(data)
+				got += len(data)
+			return b"".join(parts)
+		finally:
+			self.release_part(filenr)
 
 	def get(self, path, language_mask, language_ref):
-		file_hash = crc32r(path)
-		for offset, size, language in self.entries.get(file_hash, []):
-			if language & language_mask == language_ref:
-				return self.get_slice(offset, size)
+		i = self.lookup(path, language_mask, language_ref)
+		if i is not None:
+			return self.row_slice(i)
+
+class BigFileEntries(Mapping):
+	# read-only {hash: [(offset, size, language)]} view over the index columns
+	def __init__(self, big):
+		self.big = big
+
+	def __getitem__(self, file_hash):
+		big = self.big
+		lo, hi = big.find(file_hash)
+		if lo == hi:
+			raise KeyError(file_hash)
+		return [
+			(big.offsets[i] * 2048, big.sizes[i], big.languages[i])
+			for i in range(lo, hi)
+		]
+
+	def __iter__(self):
+		hashes = self.big.hashes
+		for i, file_hash in enumerate(hashes):
+			if i == 0 or hashes[i-1] != file_hash:
+				yield file_hash
+
+	def __len__(self):
+		return sum(1 for _ in self)
+
+	def __contains__(self, file_hash):
+		lo, hi = self.big.find(file_hash)
+		return lo != hi
 
 class UnpackedHashedGame:
 	def __init__(self, basepath, filelist = None):
@@ -142,3 +463,206 @@ def write_bigfile(f, entries):
 	for (offset, pad), (path, spec, data) in zip(offsets, entries):
 		f.write(data)
 		f.write(b"\0" * pad)
+
+class BytesSource:
+	# payload that is already in memory
+	def __init__(self, data):
+		self.data = data
+		self.size = len(data)
+
+	def chunks(self, chunk_size):
+		view = memoryview(self.data)
+		for o in range(0, self.size, chunk_size):
+			yield view[o:o+chunk_size]
+
+class FileSource:
+	# payload read from a file on disk when it is written out
+	def __init__(self, path):
+		self.path = path
+		self.size = os.path.getsize(path)
+
+	def chunks(self, chunk_size):
+		with open(self.path, "rb") as f:
+			while True:
+				chunk = f.read(chunk_size)
+				if not chunk:
+					break
+				yield chunk
+
+class BigFileSource:
+	# payload copied out of another archive
+	def __init__(self, big, path, language_mask, language_ref):
+		i = big.lookup(path, language_mask, language_ref)
+		if i is None:
+			raise KeyError(path)
+		self.big = big
+		self.offset = big.offsets[i] * 2048
+		self.size = big.sizes[i]
+
+	def chunks(self, chunk_size):
+		for o in range(0, self.size, chunk_size):
+			yield self.big.get_slice(self.offset + o, min(chunk_size, self.size - o))
+
+def as_source(data_source):
+	if hasattr(data_source, "chunks"):
+		return data_source
+	if isinstance(data_source, (str, os.PathLike)):
+		return FileSource(data_source)
+	return BytesSource(data_source)
+
+def write_bigfile_parts(path, entries, chunk_size=1<<20):
+	# entries = iterable of (path, spec, data_source) where data_source is
+	# bytes, a filename or one of the *Source classes above
+	#
+	# only the sizes are looked at to lay out the archive, payloads are then
+	# copied chunk by chunk into path (BIGFILE.000) and as many BIGFILE.001,
+	# BIGFILE.002, ... parts as needed. no payload crosses a part boundary,
+	# matching how BigFile.get_slice reads them back
+
+	entries = [
+		(crc32r(entry_path), spec, as_source(data_source))
+		for entry_path, spec, data_source in entries]
+	entries.sort(key=lambda entry: entry[0])
+
+	offset = 4 + 64 + 4 + len(entries) * 4 + len(entries) * 16
+	offset = (offset + 2047) & ~2047
+	offsets = []
+	for file_hash, spec, source in entries:
+		if source.size > part_size:
+			raise ValueError("payload of {:08x} doesn't fit in one part".format(file_hash))
+		if source.size and offset // part_size != (offset + source.size - 1) // part_size:
+			offset = (offset // part_size + 1) * part_size
+		offsets.append(offset)
+		offset += source.size
+		offset = (offset + 2047) & ~2047
+
+	header = [struct.pack("<I", part_size)]
+	header.append(b"pc-w".ljust(64, b"\0"))
+	header.append(struct.pack("<I", len(entries)))
+	header.append(struct.pack("<{}I".format(len(entries)), *(entry[0] for entry in entries)))
+	for offset, (file_hash, spec, source) in zip(offsets, entries):
+		header.append(struct.pack("<IIII", source.size, offset >> 11, spec, source.size))
+	header = b"".join(header)
+
+	base = path[:-3]
+	filenr = 0
+	f = open(path, "wb")
+	try:
+		f.write(header)
+		position = len(header)
+		for offset, (file_hash, spec, source) in zip(offsets, entries):
+			if offset // part_size != filenr:
+				f.close()
+				filenr = offset // part_size
+				f = open("{}{:03d}".format(base, filenr), "wb")
+				position = filenr * part_size
+			f.write(b"\0" * (offset - position))
+			for chunk in source.chunks(chunk_size):
+				f.write(chunk)
+			position = offset + source.size
+		f.write(b"\0" * (-position % 2048))
+	finally:
+		f.close()
+
+def default_filelists():
+	data = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+	return sorted(glob.glob(os.path.join(data, "**", "*.filelist"), recursive=True))
+
+def extract(big, outdir, names, language_mask=0, language_ref=0, workers=8, chunk_size=4<<20):
+	# unpack every entry whose language matches into outdir, using the
+	# names {hash: path} where known and the bare hash otherwise. workers
+	# share big through BigFile.read_at, which doesn't depend on a seek
+	# position.
+	# files are written under a temporary name and renamed when complete,
+	# so an interrupted run picks up where it stopped
+
+	jobs = []
+	selected = 0 # hashes with entries matching the language filter
+	unresolved = 0 # of those, hashes without a name
+	lo = 0
+	while lo < len(big.hashes):
+		file_hash = big.hashes[lo]
+		lo, hi = big.find(file_hash, lo)
+		rows = [i for i in range(lo, hi) if big.languages[i] & language_mask == language_ref]
+		if not rows:
+			lo = hi
+			continue
+		selected += 1
+		name = names.get(file_hash)
+		if name is None:
+			unresolved += 1
+			name = "{:08x}".format(file_hash)
+		else:
+			name = name.decode("utf-8", "surrogateescape").replace("\\", os.sep)
+		for i in rows:
+			if len(rows) > 1:
+				target = "{}.{:08x}".format(name, big.languages[i])
+			else:
+				target = name
+			jobs.append((big.offsets[i] * 2048, big.sizes[i], os.path.join(outdir, target)))
+		lo = hi
+
+	# go through the archive front to back
+	jobs.sort()
+
+	def work(job):
+		offset, size, target = job
+		try:
+			if os.path.getsize(target) == size:
+				return 0
+		except OSError:
+			pass
+		os.makedirs(os.path.dirname(target), exist_ok=True)
+		filenr = offset // part_size
+		position = offset % part_size
+		with open(target + ".part", "wb") as f:
+			for o in range(0, size, chunk_size):
+				f.write(big.read_at(filenr, position + o, min(chunk_size, size - o)))
+		os.replace(target + ".part", target)
+		return size
+
+	start = last_report = time.monotonic()
+	written = skipped = done = 0
+	with ThreadPoolExecutor(workers) as pool:
+		for n in pool.map(work, jobs):
+			done += 1
+			if n:
+				written += n
+			else:
+				skipped += 1
+			now = time.monotonic()
+			if now - last_report > 5:
+				last_report = now
+				print("{}/{} files, {:.1f} MB/s".format(
+					done, len(jobs), written / (now - start) / 1e6))
+
+	elapsed = max(time.monotonic() - start, 1e-9)
+	print("{} files extracted, {} already present, {:.1f} MB in {:.1f}s ({:.1f} MB/s)".format(
+		done - skipped, skipped, written / 1e6, elapsed, written / elapsed / 1e6))
+	print("{} of {} hashes unresolved".format(unresolved, selected))
+
+def main():
+	import argparse
+	parser = argparse.ArgumentParser(description="unpack a BIGFILE.000 archive")
+	sub = parser.add_subparsers(dest="command", required=True)
+	p = sub.add_parser("extract")
+	p.add_argument("bigfile", help="path to BIGFILE.000")
+	p.add_argument("outdir")
+	p.add_argument("-j", "--workers", type=int, default=8)
+	p.add_argument("--filelist", action="append",
+		help="name lists to resolve hashes with (default: all of data/)")
+	p.add_argument("--mask", type=lambda v: int(v, 0), default=0,
+		help="only extract entries where language & mask == ref")
+	p.add_argument("--ref", type=lambda v: int(v, 0), default=0)
+	args = parser.parse_args()
+
+	if args.command == "extract":
+		names = []
+		for filelist in args.filelist or default_filelists():
+			names.extend(read_filelist(filelist))
+		names = dict(zip(crc32r_many(names), names))
+		big = BigFile(args.bigfile)
+		extract(big, args.outdir, names, args.mask, args.ref, args.workers)
+
+if __name__ == '__main__':
+	main()
@@ -17,6 +17,7 @@ from bpy.props import *
 from bpy_extras.io_utils import ImportHelper
 
 import drm
+import drmstruct
 
 #def linkobject():
 #	with bpy.data.libraries.load(filepath) as (data_from, data_to):
@@ -184,25 +185,23 @@ class UnitImporter(bpy.types.Operator, ImportHelper):
 			sections, unit_i, _ = db.load(os.path.relpath(filepath, start=basepath))
 			unitref = drm.Reference(sections, sections[unit_i])
 
-			sub0 = unitref.deref(0) # Terrain
-			rel = sub0.deref(0x4)
-			cd0 = sub0.deref(0x18)
-			rel_count = sub0.access(uint16, 0x2)[0]
-			cd0_count = sub0.access(uint32, 0x14)[0]
-
-			sub30 = unitref.deref(0x30) # ADMD
-			if sub30:
-				obj_count  = sub30.access(uint32, 0x14)[0]
-				obj2_count = sub30.access(uint32, 0x1C)[0]
-				imf_count  = sub30.access(uint32, 0xA4)[0]
-				obj_ = sub30.deref(0x18)
-				imf = sub30.deref(0xA8)
+			unit = drmstruct.Unit(unitref)
+			terrain = unit.terrain
+			rel = terrain.rel
+			cd0 = terrain.cd0
+			rel_count, cd0_count = terrain.read()
+
+			admd = unit.admd
+			if admd:
+				obj_count, obj2_count, imf_count = admd.read()
+				obj_ = admd.objs
+				imfs = admd.imfs
 			else:
 				obj_count = 0
 				obj2_count = 0
 				imf_count = 0
 				obj_ = None
-				imf = None
+				imfs = []
 
 			sub50 = unitref.deref(0x50) # CellGroupData
 			streamgroups = []
@@ -325,6 +324,7 @@ class UnitImporter(bpy.types.Operator, ImportHelper):
 				obj_count = 0 # cant reconstruct transform correctly yet
 			if not self.properties.load_imf:
 				imf_count = 0
+				imfs = []
 			if not self.properties.load_cd:
 				cd0_count = 0
 
@@ -392,13 +392,11 @@ class UnitImporter(bpy.types.Operator, ImportHelper):
 					# obj_root_section.pay
 					objs.append((mat, fname, "obj"))
 
-			float4x4 = struct.Struct("<ffffffffffffffff").unpack_from
-
-			for i in range(imf_count):
-				mat = imf.access(float4x4, i*0x90)
-				dtpid = imf.access(uint32, i*0x90 + 0x48)[0]
-				fname = imf.deref(0x4C+i*0x90)
-				print("{}/{} (dtp: {:04x}) @ {}".format(i, imf_count, dtpid, imf))
+			for i, imf in enumerate(imfs):
+				mat = imf.matrix
+				dtpid = imf.dtpid
+				fname = imf.path
+				print("{}/{} (dtp: {:04x}) @ {}".format(i, imf_count, dtpid, imf.ref))
 				if dtpid and not fname:
 					dtp_intermediatemesh = db.lookup(7, dtpid)
 					dtp_intermediatemesh_imfresourcedata = dtp_intermediatemesh.deref(4)
@@ -3,6 +3,7 @@ import struct
 import sys
 
 import drm
+import drmstruct
 
 from decompiler_signature import *
 from decompiler_symbols import symbols, object_scripts
@@ -37,14 +38,15 @@ def decompile(db, script, print, path=None, decompile_functions=True):
 	# the indented part may be referenced by certain call opcodes to indicate
 	# they want to call the method implementation of a particular super-class
 
+	script_type = drmstruct.ScriptType(script)
+
 	t = Type()
 	t.parentref = parent = script.deref(0x18)
-	sizeof_members = script.access(uint16, 0x1c)[0]
+	sizeof_members = script_type.sizeof_members
 
 	num_inits = num_layout = 0
-	inits = script.deref(0x2c)
-	layout = script.deref(0x30)
-	main_func_table = script.deref(0x38)
+	inits = script_type.inits
+	layout = script_type.layout
 	if inits:
 		num_inits = inits.access(uint32, -4)[0]
 	if layout:
@@ -105,28 +107,25 @@ def decompile(db, script, print, path=None, decompile_functions=True):
 
 	t.signatures = []
 	t.functions = []
-	if main_func_table:
-		num_funcs = main_func_table.access(uint32, -4)[0]
-		for i in range(num_funcs):
-			func = main_func_table.add(0x1c * i)
-			signature = func.deref(0x0)
-			bytecode = func.deref(0x18)
-			local_inits = func.deref(0xc)
-
-			s = Signature(signature, symbols, i)
-			s.calling = set()
-			t.signatures.append(s)
-
-			signature_str = s.uq_desc
-
-			print("    " + signature_str, end="")
-			if not bytecode:
-				print("; // no bytecode")
-			elif not decompile_functions:
-				print("; // skipped decompilation")
-			else:
-				asts = decompile_function(db, s, bytecode, t, local_inits, print)
-				t.functions.append((s, asts))
+	for i, func in enumerate(script_type.functions):
+		signature = func.signature.ref
+		bytecode = func.bytecode
+		local_inits = func.local_inits
+
+		s = Signature(signature, symbols, i)
+		s.calling = set()
+		t.signatures.append(s)
+
+		signature_str = s.uq_desc
+
+		print("    " + signature_str, end="")
+		if not bytecode:
+			print("; // no bytecode")
+		elif not decompile_functions:
+			print("; // skipped decompilation")
+		else:
+			asts = decompile_function(db, s, bytecode, t, local_inits, print)
+			t.functions.append((s, asts))
 
 	print("};")
 
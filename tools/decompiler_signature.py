@@ -1,4 +1,5 @@
 import struct
+import drmstruct
 from decompiler_symbols import object_scripts
 
 uint32 = struct.Struct("<I").unpack_from
@@ -26,11 +27,9 @@ def id_name(symbols, name_a, name_b, fmt, *fmtargs):
 	else:
 		return fmt.format(name_a+"_"+name_b, *fmtargs)
 
-unpack_decl = struct.Struct("<BBxxHHxxxxHH").unpack_from
-
 class Decl:
 	def __init__(self, ref, symbols={}, decltype="decl"):
-		ty, count, w4, w6, offset, w14 = ref.access(unpack_decl)
+		ty, count, w4, w6, offset, w14 = drmstruct.Decl.read(ref)
 		tyext = ref.deref(0x8)
 
 		self.ty = ty
@@ -126,12 +125,13 @@ class Signature:
 	def read_from(self, signature, symbols, i=-1):
 		self.sigref = signature
 
-		async5 = signature.access(uint16, 0x5)[0] & 0xff
-		tableindex = signature.access(uint16, 0x6)[0]
+		header = drmstruct.FunctionSignature.read(signature)
+		async5 = header.async_
+		tableindex = header.table_index
 		if i == -1:
 			i = tableindex
-		name8 = signature.access(uint16, 0x8)[0]
-		nameA = signature.access(uint16, 0xa)[0]
+		name8 = header.name8
+		nameA = header.nameA
 
 		classname = script_type_name(signature.deref(0))
 		methodname = id_name(symbols, name8, nameA, "method_{}_{:x}", i)
@@ -1,14 +1,61 @@
-import struct, zlib, os, os.path, hashlib
+import struct, zlib, os, os.path, hashlib, array, weakref, mmap, sys
+from bisect import bisect_left
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 import bigfile
 
+try:
+	# optional, used to decode relocations in bulk (blender ships it)
+	import numpy
+except ImportError:
+	numpy = None
+
 class Section:
 	# self.s_id
 	# self.typeid
 	# self.subtypeid
 	# self.language
 	# self.fixup
-	# self.payload
-	pass
+	# self.view      memoryview of the payload, inside the DRM buffer for read()
+	# self.payload   bytes, only copied out of self.view when first accessed
+	# self.fixupinfo only decoded from self.fixup when first accessed
+
+	# there can be a lot of these, no __dict__ per section. __weakref__ is
+	# for DB.alive
+	__slots__ = ("s_id", "index", "typeid", "subtypeid", "language", "unk5", "unk6",
+		"fixup", "view", "ty_id_to_index", "_payload", "_fixupinfo", "__weakref__")
+
+	def __init__(self):
+		self._payload = None
+		self._fixupinfo = None
+
+	@property
+	def payload(self):
+		if self._payload is None:
+			self._payload = bytes(self.view)
+		return self._payload
+
+	@payload.setter
+	def payload(self, payload):
+		self._payload = payload
+		self.view = memoryview(payload)
+
+	@property
+	def fixupinfo(self):
+		if self._fixupinfo is None:
+			self._fixupinfo = read_reloc(self.fixup, self.ty_id_to_index, self.index, self.view)
+		return self._fixupinfo
+
+	@fixupinfo.setter
+	def fixupinfo(self, fixupinfo):
+		self._fixupinfo = fixupinfo
+
+	def detach(self):
+		# own copies of fixup and payload, so the section no longer keeps
+		# the buffer of the whole drm alive
+		self.payload = self.payload
+		self.fixup = bytes(self.fixup)
 
 class DRMExtraData:
 	# self.obj_dependency_list
@@ -26,7 +73,19 @@ class DRMExtraData:
 			sections,
 			root_section)
 
+	def write_to(self, f, sections, root_section):
+		return write_to(f,
+			self.obj_dependency_list,
+			self.drm_dependency_list,
+			self.unknown0C,
+			self.unknown10,
+			self.flags,
+			sections,
+			root_section)
+
 class MissingReference:
+	__slots__ = ("key",)
+
 	def __init__(self, key):
 		self.key = key
 
@@ -35,6 +94,8 @@ class MissingReference:
 		return self.key[1]
 
 class Reference:
+	__slots__ = ("sections", "section", "offset")
+
 	def __init__(self, sections, section, offset=0):
 		assert isinstance(section, Section)
 		assert isinstance(offset, int)
@@ -83,20 +144,209 @@ class Reference:
 
 
 	def access(self, unpack_from, offset=0):
-		return unpack_from(self.section.payload, self.offset + offset)
+		return unpack_from(self.section.view, self.offset + offset)
 
 	def access_null_terminated(self, offset=0):
-		try:
-			zero = self.section.payload.index(b"\x00", self.offset + offset)
-		except ValueError:
-			zero = None
-		return self.section.payload[self.offset + offset:zero]
+		# scan the view in small steps rather than copying the whole payload
+		view = self.section.view
+		start = end = self.offset + offset
+		while end < len(view):
+			zero = bytes(view[end:end+64]).find(b"\x00")
+			if zero >= 0:
+				return bytes(view[start:end+zero])
+			end += 64
+		return bytes(view[start:])
 
 	def valid(self):
-		return self.offset < len(self.section.payload)
-
-import pickle
+		return self.offset < len(self.section.view)
+
+class Patch:
+	# byte range edits to the section payloads of one drm. since sizes and
+	# relocations stay as they are, the patched drm is a copy of the
+	# original one with the edits applied, see DB.patch
+	def __init__(self, data, header):
+		self.data = data # unpacked drm
+		self.header = header
+		self.edits = [] # [(offset in drm, bytes)]
+
+	def put(self, reference, offset, data):
+		# overwrite payload bytes at reference.offset + offset
+		section = reference.section
+		entry = self.header.table[section.index]
+		assert (entry[1], entry[5]) == (section.typeid, section.s_id), "reference is from another drm"
+		offset += reference.offset
+		assert 0 <= offset and offset + len(data) <= entry[0]
+		self.edits.append((entry[8] + offset, bytes(data)))
+
+	def pack(self, reference, fmt, offset, *values):
+		self.put(reference, offset, struct.pack(fmt, *values))
+
+	def copy(self):
+		# another patch of the same drm starting from these edits, so
+		# variants don't need the drm loaded and unpacked again
+		patch = Patch(self.data, self.header)
+		patch.edits = list(self.edits)
+		return patch
+
+	def write(self):
+		# the patched drm, later edits win where they overlap
+		out = bytearray(self.data)
+		for offset, data in self.edits:
+			out[offset:offset+len(data)] = data
+		return out
+
+class SectionIndex:
+	# on-disk table {(typeid, s_id): (drm path, section index, payload offset,
+	# payload size)} covering a whole game, see DB.create_index. the file is
+	# mapped and searched in place:
+	#
+	#   header   "DRMI", version, count, path count, path bytes
+	#   keys     uint64[count]  (typeid << 32) | s_id, sorted
+	#   drms     uint32[count]  index into the paths
+	#   sections uint32[count]
+	#   offsets  uint32[count]  payload offset in the unpacked drm
+	#   sizes    uint32[count]
+	#   paths    utf-8, \0 separated
+
+	magic = b"DRMI"
+	version = 1
+	header = struct.Struct("<4sIIII")
+
+	def __init__(self, path):
+		with open(path, "rb") as f:
+			self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, version, count, path_count, path_size = self.header.unpack_from(self.mapping)
+		assert magic == self.magic and version == self.version
+		data = memoryview(self.mapping)
+		o = self.header.size
+		self.keys = self.column(data[o:o+8*count], "Q"); o += 8*count
+		self.drms = self.column(data[o:o+4*count], "I"); o += 4*count
+		self.sections = self.column(data[o:o+4*count], "I"); o += 4*count
+		self.offsets = self.column(data[o:o+4*count], "I"); o += 4*count
+		self.sizes = self.column(data[o:o+4*count], "I"); o += 4*count
+		self.paths = bytes(data[o:o+path_size]).decode("utf-8").split("\0") if path_count else []
+		assert len(self.paths) == path_count
+
+	@staticmethod
+	def column(data, typecode):
+		if sys.byteorder == "little":
+			return data.cast(typecode)
+		a = array.array(typecode)
+		a.frombytes(data)
+		a.byteswap()
+		return a
+
+	def get(self, typeid, s_id):
+		# (drm path, section index, payload offset, payload size) or None
+		key = (typeid << 32) | s_id
+		i = bisect_left(self.keys, key)
+		if i == len(self.keys) or self.keys[i] != key:
+			return None
+		return self.paths[self.drms[i]], self.sections[i], self.offsets[i], self.sizes[i]
 
+	def __len__(self):
+		return len(self.keys)
+
+	@classmethod
+	def write(cls, path, paths, rows):
+		# rows = [(typeid, s_id, drm index into paths, section index, payload offset, payload size)]
+		rows = sorted(rows, key=lambda row: (row[0] << 32) | row[1])
+		def column(typecode, values):
+			a = array.array(typecode, values)
+			if sys.byteorder != "little":
+				a.byteswap()
+			return a.tobytes()
+		path_bytes = "\0".join(paths).encode("utf-8")
+		tmppath = "{}.{}.tmp".format(path, os.getpid())
+		with open(tmppath, "wb") as f:
+			f.write(cls.header.pack(cls.magic, cls.version, len(rows), len(paths), len(path_bytes)))
+			f.write(column("Q", [(row[0] << 32) | row[1] for row in rows]))
+			for i in range(2, 6):
+				f.write(column("I", [row[i] for row in rows]))
+			f.write(path_bytes)
+		os.replace(tmppath, path)
+
+class CDRMCache:
+	# directory of unpacked drms named after a hash of the CDRM they came
+	# from. files are mapped rather than read, and the least recently used
+	# ones (by mtime, which get touches) go once there are more than budget
+	# bytes of them
+
+	def __init__(self, path, budget=2<<30):
+		self.path = path
+		self.budget = budget
+		self.total = None # bytes in the directory, counted on the first put
+		os.makedirs(path, exist_ok=True)
+
+	def key(self, data):
+		return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+	def get(self, data, key=None):
+		fname = os.path.join(self.path, (key or self.key(data)) + ".drm")
+		try:
+			with open(fname, "rb") as f:
+				if os.fstat(f.fileno()).st_size == 0:
+					return b""
+				out = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		except OSError:
+			return None
+		try:
+			os.utime(fname)
+		except OSError:
+			pass
+		return out
+
+	def put(self, data, out, key=None):
+		fname = os.path.join(self.path, (key or self.key(data)) + ".drm")
+		tmpname = "{}.{}.tmp".format(fname, os.getpid())
+		with open(tmpname, "wb") as f:
+			f.write(out)
+		if self.total is None:
+			self.total = self.scan()[0]
+		try:
+			self.total -= os.stat(fname).st_size
+		except OSError:
+			pass
+		os.replace(tmpname, fname)
+		self.total += len(out)
+		if self.total > self.budget:
+			self.trim()
+
+	def scan(self):
+		# (total size, [(mtime, size, path)] least recently used first)
+		files = []
+		total = 0
+		for entry in os.scandir(self.path):
+			if entry.name.endswith(".drm"):
+				st = entry.stat()
+				files.append((st.st_mtime_ns, st.st_size, entry.path))
+				total += st.st_size
+		files.sort()
+		return total, files
+
+	def trim(self):
+		# down to 3/4 of the budget, so it isn't rescanned on every put
+		# once the cache is full
+		total, files = self.scan()
+		for mtime, size, fname in files:
+			if total <= self.budget * 3 // 4:
+				break
+			try:
+				os.remove(fname)
+			except OSError:
+				continue # still mapped somewhere (windows)
+			total -= size
+		self.total = total
+
+	def cdrm(self, data, workers=None, key=None):
+		if data[0:4] != b"CDRM":
+			return data
+		key = key or self.key(data)
+		out = self.get(data, key)
+		if out is None:
+			out = cdrm(data, workers)
+			self.put(data, out, key)
+		return out
 
 class DBSections:
 	def __init__(self, db, drm_id):
@@ -115,9 +365,10 @@ class DBSections:
 	def get(self, i):
 		if isinstance(i, tuple):
 			typeid, s_id = i
-			if (typeid, s_id) not in self.db.index:
+			location = self.db.find(typeid, s_id)
+			if location is None:
 				return None
-			drm_id, section_index = self.db.index[typeid, s_id]
+			drm_id, section_index = location
 			assert isinstance(section_index, int)
 		else:
 			drm_id, section_index = self.drm_id, i
@@ -126,8 +377,51 @@ class DBSections:
 		section = self.db.load_single(drm_id, section_index)
 		return DBSections(self.db, drm_id), section
 
+class DRMBuffer:
+	# a drm the DB makes sections from. for CDRM files the packed data is
+	# kept and blocks are unpacked into view the first time a section in
+	# them is asked for, so neither the file nor blocks shared by sections
+	# are read or unpacked twice while this is cached
+	def __init__(self, drm_id, data):
+		self.drm_id = drm_id
+		self.packed = None
+		self.blocks = [] # blocks of packed not unpacked yet
+		if data[0:4] == b"CDRM":
+			self.packed = data
+			self.blocks = cdrm_blocks(data)
+			data = bytearray(sum(align16(block[4]) for block in self.blocks))
+		self.view = memoryview(data)
+		self.size = len(self.view) + (len(self.packed) if self.packed is not None else 0)
+
+	def range(self, start, end):
+		# make sure [start, end) of the unpacked drm is there
+		if self.blocks:
+			remaining = []
+			for block in self.blocks:
+				if block[3] < end and block[3] + align16(block[4]) > start:
+					cdrm_block(self.packed, block, self.view)
+				else:
+					remaining.append(block)
+			self.blocks = remaining
+		return self.view[start:end]
+
+class CachedBuffer:
+	# the sections in DB.cache that share one backing buffer (usually a
+	# whole unpacked drm). they are counted and evicted together, since
+	# memory only comes back once none of them holds the buffer any more
+	def __init__(self, buffer, size, drm=None):
+		self.buffer = buffer # keeps id(buffer) from being reused
+		self.drm = drm # DRMBuffer when buffer is one
+		self.size = size # the buffer, plus fixups and payload copies outside of it
+		self.sections = {} # {(drm_id, section_index): section}
+		self.payloads = set() # keys whose payload copy is counted in size
+
+def section_buffer(section):
+	# whatever the payload view of a section points into
+	return section.view.obj
+
 class DB:
-	def __init__(self, basepath_or_bigfile, specmask=0xBFFF0001):
+	def __init__(self, basepath_or_bigfile, specmask=0xBFFF0001, cache_budget=512<<20, index_path=None, cdrm_cache=None):
 		if isinstance(basepath_or_bigfile, bigfile.BigFile):
 			self.basepath = None
 			self.bigfile = basepath_or_bigfile
@@ -135,78 +429,191 @@ class DB:
 			self.basepath = basepath_or_bigfile
 			self.bigfile = None
 		self.index = {} # {(type, id): {(drm_id, section)}}
-		self.cache = {} # {(drm_id, section_index): section}
-		self.lru = [] # [(drm_id, num_sections)]
+		self.cache = OrderedDict() # {id(buffer): CachedBuffer}, least recently used first
+		self.cached = {} # {(drm_id, section_index): id(buffer)}
+		self.drm_buffers = {} # {drm_id: id(DRMBuffer)} for those in self.cache
+		self.cache_budget = cache_budget # bytes of buffers kept alive by self.cache
+		self.cache_size = 0
+		# sections evicted from self.cache that are still referenced from
+		# somewhere else, handed out again instead of loading a copy
+		self.alive = weakref.WeakValueDictionary() # {(drm_id, section_index): section}
+		self.drms = {} # {drm_id: (root_section, extra)} for fully loaded drms
+		self.headers = {} # {drm_id: DRMHeader}
 		self.section_count = {} # {drm_id: num_sections}
 		self.specmask = specmask
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.global_index = None # SectionIndex
+		self.cdrm_cache = cdrm_cache # CDRMCache
+		self.cdrm_keys = {} # {drm_id: CDRMCache.key}, hashing a drm once
+		if index_path:
+			self.read_index(index_path)
+
+	def find(self, typeid, s_id):
+		# (drm_id, section_index) of a section, from the drms seen so far or
+		# from the global index
+		location = self.index.get((typeid, s_id))
+		if location is None and self.global_index is not None:
+			location = self.global_index.get(typeid, s_id)
+			if location is not None:
+				location = location[:2]
+		return location
 
 	def lookup(self, typeid, s_id):
-		if (typeid, s_id) not in self.index:
+		location = self.find(typeid, s_id)
+		if location is None:
 			return None
 
-		drm_id, section_index = self.index[typeid, s_id]
-		sections, _, _ = self.load(drm_id)
-		return Reference(DBSections(self, drm_id), sections[section_index])
-
-	#def create_index(self, indexpath, fnames):
-	#	index = []
-	#	for fname in fnames:
-	#		print(fname)
-	#		with open(os.path.join(self.basepath, fname), "rb") as f:
-	#			data = f.read()
-	#
-	#		if data[0:4] == b"CDRM":
-	#			data = drm.cdrm(data)
-	#		data = read(data)
-	#		if not data: continue
-	#		sections, root = data
-	#
-	#		sectioninfo = []
-	#		for sec in sections:
-	#			p = sec.payload
-	#			sectioninfo.append((hash(p), len(p), sec.fixup, p if len(p) < 1000 else None))
-	#
-	#		index.append((fname, sectioninfo))
-	#
-	#	with open(indexpath, "wb") as f:
-	#		pickle.dump(y, f)
-
-	#def read_index(self, indexpath):
-	#	with open(indexpath, "rb") as f:
-	#		index = pickle.load(f)
-	#
-	#	self.index2 = index
+		drm_id, section_index = location
+		section = self.load_single(drm_id, section_index)
+		return Reference(DBSections(self, drm_id), section)
+
+	def create_index(self, indexpath, fnames, workers=8):
+		# scan the headers of all fnames and write a SectionIndex of every
+		# section in them to indexpath. only the CDRM blocks holding the
+		# headers get unpacked
+		def scan(fname):
+			data = self.load_raw(fname)
+			if data is None or len(data) < 32:
+				return None
+			return read_header_packed(data, self.specmask)
+
+		fnames = list(fnames)
+		rows = []
+		with ThreadPoolExecutor(workers) as pool:
+			for drm_index, header in enumerate(pool.map(scan, fnames)):
+				if header is None:
+					continue
+				for i, entry in enumerate(header.table):
+					rows.append((entry[1], entry[5], drm_index, i, entry[8], entry[0]))
+
+		SectionIndex.write(indexpath, fnames, rows)
+
+	def read_index(self, indexpath):
+		self.global_index = SectionIndex(indexpath)
+
+	def cache_get(self, key):
+		buffer_id = self.cached.get(key)
+		if buffer_id is not None:
+			self.cache.move_to_end(buffer_id)
+			entry = self.cache[buffer_id]
+			section = entry.sections[key]
+			self.count_payload(entry, key, section)
+			return section
+		section = self.alive.get(key)
+		if section is not None:
+			self.cache_put(key, section)
+		return section
+
+	def cache_put(self, key, section, drm=None):
+		# drm is the DRMBuffer the section was made from, which is charged
+		# rather than all of what section.view points into (eg. a drm inside
+		# a mapped bigfile part)
+		buffer_id = self.cached.get(key)
+		if buffer_id is not None:
+			self.cache.move_to_end(buffer_id)
+			return
+		base = section_buffer(section)
+		buffer = base if drm is None else drm
+		buffer_id = id(buffer)
+		entry = self.cache.get(buffer_id)
+		if entry is None:
+			size = len(base) if drm is None else drm.size
+			entry = self.cache[buffer_id] = CachedBuffer(buffer, size, drm)
+			self.cache_size += entry.size
+			if drm is not None:
+				self.drm_buffers[drm.drm_id] = buffer_id
+		else:
+			self.cache.move_to_end(buffer_id)
+		if not (isinstance(section.fixup, memoryview) and section.fixup.obj is base):
+			entry.size += len(section.fixup)
+			self.cache_size += len(section.fixup)
+		entry.sections[key] = section
+		self.cached[key] = buffer_id
+		self.count_payload(entry, key, section)
+
+	def count_payload(self, entry, key, section):
+		# payload copies are made on first use, after the section went into
+		# the cache, so they get counted when next seen
+		payload = section._payload
+		if payload is not None and key not in entry.payloads and payload is not section_buffer(section):
+			entry.payloads.add(key)
+			entry.size += len(payload)
+			self.cache_size += len(payload)
 
 	def clean_cache(self):
-
-		# caching system isn't done yet, so don't evict anything yet
-		# (this means that your python process will keep using more and more memory)
-		return
-
-		if len(self.lru) > 10:
-			evict, root, num = self.lru.pop(0)
-			for i in range(num):
-				if (evict, i) in self.cache:
-					s = self.cache[evict, i]
-					if len(s.payload) > 1000 and s.typeid != 8:
-						del self.cache[evict, i]
+		# evict least recently used buffers until within budget, except the
+		# most recent one which the caller is still using. sections that are
+		# still referenced elsewhere stay reachable through self.alive, so
+		# they are never loaded twice, but get their own copies of their
+		# data so they don't pin the whole buffer
+		while self.cache_size > self.cache_budget and len(self.cache) > 1:
+			buffer_id, entry = self.cache.popitem(last=False)
+			self.cache_size -= entry.size
+			if entry.drm is not None and self.drm_buffers.get(entry.drm.drm_id) == buffer_id:
+				del self.drm_buffers[entry.drm.drm_id]
+			keys = list(entry.sections)
+			for key in keys:
+				del self.cached[key]
+				self.alive[key] = entry.sections[key]
+			self.evictions += len(keys)
+			entry = None
+			for key in keys:
+				section = self.alive.get(key)
+				if section is not None:
+					section.detach()
+			section = None
 
 	def load_single(self, path, section_index):
 		assert isinstance(section_index, int)
 		drm_id = path
 
-		if (drm_id, section_index) in self.cache:
-			for i, (l_drm_id, l_root, l_num) in enumerate(self.lru):
-				if drm_id == l_drm_id:
-					self.lru.extend(self.lru[i:i+1])
-					del self.lru[i:i+1]
-					break
-			return self.cache[drm_id, section_index]
-
-		sections, root = self.load_internal(path)
-		s = sections[section_index]
-		assert False
-		return s
+		section = self.cache_get((drm_id, section_index))
+		if section is not None:
+			self.hits += 1
+			return section
+
+		# only unpack and parse the part of the drm this section is in
+		self.misses += 1
+		drm = self.drm_buffer(drm_id)
+		header = self.headers.get(drm_id)
+		if header is None:
+			size = header_size(drm.range(0, 32))
+			header = self.add_header(drm_id, read_header(drm.range(0, size), self.specmask))
+		entry = header.table[section_index]
+		drm.range(entry[7], entry[8] + entry[0])
+		section = make_section(drm.view, header, section_index)
+		self.cache_put((drm_id, section_index), section, drm)
+		self.clean_cache()
+		return section
+
+	def drm_buffer(self, drm_id, data=None):
+		# the cached DRMBuffer of drm_id, or a new one of data (by default
+		# the file as it is, or unpacked from the cdrm cache)
+		buffer_id = self.drm_buffers.get(drm_id)
+		if buffer_id is not None:
+			return self.cache[buffer_id].drm
+		if data is None:
+			data = self.load_raw(drm_id)
+			if self.cdrm_cache and data[0:4] == b"CDRM":
+				unpacked = self.cdrm_cache.get(data, self.cdrm_key(drm_id, data))
+				if unpacked is not None:
+					data = unpacked
+		return DRMBuffer(drm_id, data)
+
+	def load_header(self, drm_id, data, blocks=None):
+		header = self.headers.get(drm_id)
+		if header is None:
+			header = self.add_header(drm_id, read_header_packed(data, self.specmask, blocks))
+		return header
+
+	def add_header(self, drm_id, header):
+		self.headers[drm_id] = header
+		for i, entry in enumerate(header.table):
+			self.index[entry[1], entry[5]] = drm_id, i
+		self.section_count[drm_id] = len(header.table)
+		return header
 
 	def load(self, path):
 		drm_id = path
@@ -220,131 +627,306 @@ class DB:
 		if self.bigfile:
 			return self.bigfile.get(path, self.specmask, self.specmask)
 
-	def load_internal(self, path):
-		drm_id = path
-
-		for i, (l_drm_id, l_root, l_num) in enumerate(self.lru):
-			if drm_id == l_drm_id:
-				self.lru.extend(self.lru[i:i+1])
-				del self.lru[i:i+1]
-				return [
-					self.cache[drm_id, i] for i in range(l_num)
-				], l_root, None
-
+	def load_unpacked(self, path):
 		data = self.load_raw(path)
-		if data[0:4] == b"CDRM":
-			data = cdrm(data)
-
-		sections, root, extra = read(data, specmask=self.specmask)
+		if self.cdrm_cache and data[0:4] == b"CDRM":
+			return self.cdrm_cache.cdrm(data, key=self.cdrm_key(path, data))
+		return cdrm(data)
+
+	def cdrm_key(self, drm_id, data):
+		key = self.cdrm_keys.get(drm_id)
+		if key is None:
+			key = self.cdrm_keys[drm_id] = self.cdrm_cache.key(data)
+		return key
+
+	def patch(self, path):
+		data = self.cached_drm(path)
+		if data is None:
+			data = self.load_unpacked(path)
+		return Patch(data, self.load_header(path, data))
+
+	def cached_drm(self, drm_id):
+		# the unpacked drm behind cached sections of drm_id, unpacking the
+		# blocks no section needed so far
+		buffer_id = self.drm_buffers.get(drm_id)
+		if buffer_id is None:
+			return None
+		self.cache.move_to_end(buffer_id)
+		drm = self.cache[buffer_id].drm
+		return drm.range(0, len(drm.view))
 
-		for i, section in enumerate(sections):
-			self.index[section.typeid, section.s_id] = drm_id, i
-			self.cache[drm_id, i] = section
+	def load_internal(self, path):
+		drm_id = path
 
+		if drm_id in self.drms:
+			root, extra = self.drms[drm_id]
+			sections = [self.cache_get((drm_id, i)) for i in range(self.section_count[drm_id])]
+			if None not in sections:
+				self.hits += 1
+				return sections, root, extra
+
+		self.misses += 1
+		data = self.cached_drm(drm_id)
+		if data is None:
+			data = self.load_unpacked(path)
+		header = self.load_header(drm_id, data)
+		return self.add_drm(drm_id, data, header)
+
+	def add_drm(self, drm_id, data, header):
+		root, extra = header.root_section, header.extra
+		drm = self.drm_buffer(drm_id, data)
+		drm.range(0, len(drm.view)) # a cached one may be partly unpacked
+		sections = []
+		for i in range(len(header.table)):
+			# keep using sections of this drm that are still around
+			section = self.cache_get((drm_id, i)) or make_section(drm.view, header, i)
+			self.cache_put((drm_id, i), section, drm)
+			sections.append(section)
+
+		self.drms[drm_id] = root, extra
 		self.clean_cache()
 
-		self.lru.append((drm_id, root, len(sections)))
-		self.section_count[drm_id] = len(sections)
-
 		return sections, root, extra
 
+	def load_many(self, paths, workers=None):
+		# like load() for many paths at once, yields (path, sections,
+		# root_section, extra) in the order the drms finish. reading,
+		# unpacking and parsing the header happen in worker processes
+		pending = []
+		for path in paths:
+			if path in self.drms:
+				yield (path,) + self.load(path)
+			else:
+				pending.append(path)
+		if not pending:
+			return
 
-def align16(v): return (v+15)&~15
-
-def cdrm(data):
-	magic, version, count, padding = struct.unpack("<IIII", data[:16])
-	if magic != 0x4D524443:
-		return data
+		if self.bigfile:
+			source = None, self.bigfile.path, self.bigfile.filelist
+		else:
+			source = self.basepath, None, None
+		cache = self.cdrm_cache
+		cache = (cache.path, cache.budget) if cache else None
+
+		with ProcessPoolExecutor(workers, initializer=load_many_init,
+			initargs=(source, self.specmask, cache)) as pool:
+			futures = [pool.submit(load_many_worker, path) for path in pending]
+			for future in as_completed(futures):
+				path, data, header = future.result()
+				drm_id = path
+				if drm_id in self.drms:
+					yield (path,) + self.load(path)
+					continue
+				self.misses += 1
+				if drm_id not in self.headers:
+					self.add_header(drm_id, header)
+				sections, root, extra = self.add_drm(drm_id, data, self.headers[drm_id])
+				yield path, DBSections(self, drm_id), root, extra
+
+load_many_db = None
+
+def load_many_init(source, specmask, cache):
+	global load_many_db
+	basepath, bigfile_path, filelist = source
+	if bigfile_path:
+		basepath = bigfile.BigFile(bigfile_path, filelist)
+	cache = CDRMCache(*cache) if cache else None
+	load_many_db = DB(basepath, specmask, cdrm_cache=cache)
+
+def load_many_worker(path):
+	db = load_many_db
+	data = bytes(db.load_unpacked(path))
+	return path, data, read_header(data, db.specmask)
 
-	c = 16 + count*8
-	c = align16(c)
 
-	outparts = []
+def align16(v): return (v+15)&~15
 
-	for u, (info, packed_size) in enumerate(struct.iter_unpack("<II", data[16:16+8*count])):
+def cdrm_blocks(data):
+	# [(dtype, packed_offset, packed_size, unpacked_offset, unpacked_size)]
+	# every block starts 16 byte aligned, both packed and unpacked
+	magic, version, count, padding = struct.unpack("<IIII", data[:16])
+	c = align16(16 + count*8)
+	u = 0
+	blocks = []
+	for info, packed_size in struct.iter_unpack("<II", data[16:16+8*count]):
 		unpacked_size = info >> 8
 		dtype = info & 255
+		blocks.append((dtype, c, packed_size, u, unpacked_size))
+		c += align16(packed_size)
+		u += align16(unpacked_size)
+	return blocks
 
-		d = data[c:c+packed_size]
+def cdrm_block(data, block, out):
+	# unpack a single block into its place in out
+	dtype, c, packed_size, u, unpacked_size = block
+	d = data[c:c+packed_size]
 
-		if dtype == 1:
-			pass
+	if dtype == 1:
+		pass
 
-		elif dtype == 2:
-			d = zlib.decompress(d)
+	elif dtype == 2:
+		d = zlib.decompress(d)
 
-		else:
-			assert False
+	else:
+		assert False
 
-		assert len(d) == unpacked_size
-		padding = ((16-len(d))&0xf)
-		outparts.append(d)
-		outparts.append(b"\0" * padding)
-		c += (packed_size + 0xf) & ~0xf
-		#print(100*u//count, "%")
+	assert len(d) == unpacked_size
+	out[u:u+unpacked_size] = d
+
+def cdrm_iter(data):
+	# yields memoryviews of the unpacked blocks as soon as each one is done,
+	# all of them are views of the same bytearray (block.obj) which holds
+	# the complete DRM after the last one
+	blocks = cdrm_blocks(data)
+	out = bytearray(sum(align16(block[4]) for block in blocks))
+	view = memoryview(out)
+	for block in blocks:
+		cdrm_block(data, block, out)
+		yield view[block[3]:block[3]+align16(block[4])]
+
+def cdrm_range(data, start, end, blocks=None):
+	# unpack just the blocks covering [start, end) of the output, returns a
+	# memoryview of that range
+	if blocks is None:
+		blocks = cdrm_blocks(data)
+	covering = [block for block in blocks
+		if block[3] < end and block[3] + align16(block[4]) > start]
+	if not covering:
+		return memoryview(b"")
+	base = covering[0][3]
+	out = bytearray(covering[-1][3] + align16(covering[-1][4]) - base)
+	for dtype, c, packed_size, u, unpacked_size in covering:
+		cdrm_block(data, (dtype, c, packed_size, u - base, unpacked_size), out)
+	return memoryview(out)[start - base:end - base]
+
+def cdrm(data, workers=None):
+	magic, = struct.unpack("<I", data[:4])
+	if magic != 0x4D524443:
+		return data
 
-	return b"".join(outparts)
+	# one preallocated buffer sized from the block headers, no list of parts
+	blocks = cdrm_blocks(data)
+	out = bytearray(sum(align16(block[4]) for block in blocks))
+
+	if workers and len(blocks) > 1:
+		# zlib.decompress releases the GIL, so threads are enough to have
+		# blocks decompress side by side into their own slots
+		with ThreadPoolExecutor(workers) as pool:
+			for _ in pool.map(lambda block: cdrm_block(data, block, out), blocks):
+				pass
+	else:
+		for block in blocks:
+			cdrm_block(data, block, out)
+	return out
+
+
+class DRMHeader:
+	# everything in front of the first section, plus where every section's
+	# fixup and payload are in the unpacked drm
+	#
+	# self.root_section
+	# self.extra          DRMExtraData
+	# self.table          [(payload_size, typeid, unknown05, unknown06,
+	#                       reloc_size_and_flags, s_id, language,
+	#                       fixup_offset, payload_offset)]
+	# self.ty_id_to_index
+	pass
 
+def header_size(data):
+	# how much of the start of an unpacked drm read_header looks at
+	version, drm_dependency_list_size, obj_dependency_list_size, unknown0C, \
+	unknown10, flags, section_count, root_section = struct.unpack("<IIIIIIII", data[:32])
+	if version not in (19, 21):
+		return 32
+	return 32 + section_count*20 + obj_dependency_list_size + drm_dependency_list_size
 
-def read(data, *, check=False, specmask=0xBFFF0001):
+def read_header(data, specmask=0xBFFF0001):
 	version, drm_dependency_list_size, obj_dependency_list_size, unknown0C, \
 	unknown10, flags, section_count, root_section = struct.unpack("<IIIIIIII", data[:32])
 
 	if version not in (19, 21):
-		return None, None, None
+		return None
 
 	realign = flags & 1 # TODO
 	cursor = 32 + section_count*20
-	obj_dependency_list = data[cursor:cursor + obj_dependency_list_size]
+	obj_dependency_list = bytes(data[cursor:cursor + obj_dependency_list_size])
 	cursor = 32 + section_count*20 + obj_dependency_list_size
-	drm_dependency_list = data[cursor:cursor + drm_dependency_list_size]
+	drm_dependency_list = bytes(data[cursor:cursor + drm_dependency_list_size])
 	cursor = 32 + section_count*20 + obj_dependency_list_size + drm_dependency_list_size
 	cursor = (cursor+15) & ~15
 
 	ty_id_to_index = {}
+	table = []
 
 	for i, (payloadSize, typeid, unknown05, unknown06, reloc_size_and_flags, s_id, language) in \
 		enumerate(struct.iter_unpack("<IBBHIII", data[32:32+section_count*20])):
-		if language & specmask != specmask:
-			continue
-		ty_id_to_index[typeid, s_id] = i
+		if language & specmask == specmask:
+			ty_id_to_index[typeid, s_id] = i
 
-	sections = []
-
-	for i, (payloadSize, typeid, unknown05, unknown06, reloc_size_and_flags, s_id, language) in \
-		enumerate(struct.iter_unpack("<IBBHIII", data[32:32+section_count*20])):
-
-		sec = Section()
-		sec.s_id = s_id
-		sec.index = i
-		sec.typeid = typeid
-		sec.subtypeid = (reloc_size_and_flags >> 1) & 0x7f
-		sec.language = language
-		sec.unk5 = unknown05
-		sec.unk6 = unknown06
-		reloc_size = reloc_size_and_flags >> 8
-
-		sec.fixup = data[cursor:cursor+reloc_size]
-		cursor += reloc_size
+		fixup_offset = cursor
+		cursor += reloc_size_and_flags >> 8
 		cursor = align16(cursor)
-
-		sec.payload = data[cursor:cursor+payloadSize]
+		payload_offset = cursor
 		cursor += payloadSize
 		cursor = align16(cursor)
 
-		sec.fixupinfo = read_reloc(sec.fixup, ty_id_to_index, len(sections), sec.payload)
+		table.append((payloadSize, typeid, unknown05, unknown06,
+			reloc_size_and_flags, s_id, language, fixup_offset, payload_offset))
+
+	extra = DRMExtraData()
+	extra.obj_dependency_list = obj_dependency_list
+	extra.drm_dependency_list = drm_dependency_list
+	extra.unknown0C = unknown0C
+	extra.unknown10 = unknown10
+	extra.flags = flags
+
+	header = DRMHeader()
+	header.root_section = root_section
+	header.extra = extra
+	header.table = table
+	header.ty_id_to_index = ty_id_to_index
+	return header
+
+def make_section(data, header, i, base=0):
+	# section i of the drm described by header, data holds the drm (or the
+	# part of it starting at offset base) and the section keeps views of it
+	payloadSize, typeid, unknown05, unknown06, reloc_size_and_flags, s_id, language, \
+		fixup_offset, payload_offset = header.table[i]
+
+	sec = Section()
+	sec.s_id = s_id
+	sec.index = i
+	sec.typeid = typeid
+	sec.subtypeid = (reloc_size_and_flags >> 1) & 0x7f
+	sec.language = language
+	sec.unk5 = unknown05
+	sec.unk6 = unknown06
+	reloc_size = reloc_size_and_flags >> 8
+
+	sec.fixup = data[fixup_offset - base:fixup_offset - base + reloc_size]
+	sec.view = data[payload_offset - base:payload_offset - base + payloadSize]
+
+	# for fixupinfo, decoded on first use
+	sec.ty_id_to_index = header.ty_id_to_index
+
+	return sec
 
-		sections.append(sec) #, unknown05, unknown06, reloc_size_and_flags & 0xff])
+def read(data, *, check=False, specmask=0xBFFF0001):
+	# data is an unpacked drm, or a CDRM which gets unpacked on the way
+	if data[0:4] == b"CDRM":
+		data, header, sections = read_cdrm(data, specmask)
+	else:
+		header = read_header(data, specmask)
+		# sections keep views into data instead of copies of their parts
+		data = memoryview(data)
+		sections = header and [make_section(data, header, i) for i in range(len(header.table))]
+	if header is None:
+		return None, None, None
+
+	extra = header.extra
 
 	if check:
-		data2 = write(
-			obj_dependency_list,
-			drm_dependency_list,
-			unknown0C,
-			unknown10,
-			flags,
-			sections,
-			root_section)
+		data2 = extra.write(sections, header.root_section)
 
 		if False:
 			import binascii
@@ -354,70 +936,364 @@ def read(data, *, check=False, specmask=0xBFFF0001):
 		assert len(data) == len(data2), (len(data), len(data2))
 		assert data == data2
 
-	extra = DRMExtraData()
-	extra.obj_dependency_list = obj_dependency_list
-	extra.drm_dependency_list = drm_dependency_list
-	extra.unknown0C = unknown0C
-	extra.unknown10 = unknown10
-	extra.flags = flags
-
-	return sections, root_section, extra
+	return sections, header.root_section, extra
 
-def pad16join(parts):
-	allparts = []
-	count = 0
-	for part in parts:
-		allparts.append(part); count += len(part)
-		npad = (-count) % 16
-		allparts.append(b"\0" * npad); count += npad
-	return b"".join(allparts)
+def read_cdrm(data, specmask=0xBFFF0001):
+	# the header is parsed as soon as the blocks holding it are unpacked,
+	# and each section is made once the blocks up to its payload are, while
+	# the rest of the drm is still compressed
+	header = None
+	sections = []
+	done = 0
+	view = None
+	for block in cdrm_iter(data):
+		view = memoryview(block.obj)
+		done += len(block)
+		if header is None:
+			if done < 32 or done < header_size(view):
+				continue
+			header = read_header(view, specmask)
+			if header is None:
+				return view, None, None
+		while len(sections) < len(header.table):
+			entry = header.table[len(sections)]
+			if entry[8] + entry[0] > done:
+				break
+			sections.append(make_section(view, header, len(sections)))
+	if header is None or len(sections) < len(header.table):
+		return view, None, None
+	return view, header, sections
+
+def drm_range(data, start, end, blocks=None):
+	# bytes [start, end) of the unpacked drm, for CDRM files only the
+	# blocks overlapping that range are unpacked
+	if data[0:4] != b"CDRM":
+		return memoryview(data)[start:end]
+	return cdrm_range(data, start, end, blocks)
+
+def read_header_packed(data, specmask=0xBFFF0001, blocks=None):
+	# read_header for CDRM files that only unpacks the blocks it needs
+	size = header_size(drm_range(data, 0, 32, blocks))
+	return read_header(drm_range(data, 0, size, blocks), specmask)
+
+def read_single(data, header, i, blocks=None):
+	# section i from a packed or unpacked drm, only unpacking the blocks it
+	# is in, see read_header_packed to get the header
+	payloadSize, typeid, unknown05, unknown06, reloc_size_and_flags, s_id, language, \
+		fixup_offset, payload_offset = header.table[i]
+	end = payload_offset + payloadSize
+	return make_section(drm_range(data, fixup_offset, end, blocks), header, i, fixup_offset)
+
+def write_layout(obj_dependency_list, drm_dependency_list, sections):
+	# where everything goes in the written drm, before writing any of it:
+	# (header_size, [(fixup_offset, payload_offset)], total_size)
+	cursor = align16(32 + len(sections)*20 + len(obj_dependency_list) + len(drm_dependency_list))
+	header_size = cursor
+	offsets = []
+	for section in sections:
+		fixup_offset = cursor
+		cursor = align16(cursor + len(section.fixup))
+		offsets.append((fixup_offset, cursor))
+		cursor = align16(cursor + len(section.view))
+	return header_size, offsets, cursor
 
-def write(obj_dependency_list, drm_dependency_list, unknown0C,
+def write_header_into(buf, obj_dependency_list, drm_dependency_list, unknown0C,
 	unknown10, flags, sections, root_section):
-
-	parts = []
-
-	#obj_dependency_list = b"\0".join(obj_dependency_list)
-	#drm_dependency_list = b"\0".join(drm_dependency_list)
-
-	header = struct.pack("<IIIIIIII", 21,
+	# header and section table in one pack_into, then the dependency lists
+	values = [21,
 		len(drm_dependency_list),
 		len(obj_dependency_list),
-		unknown0C, unknown10, flags, len(sections), root_section)
-
+		unknown0C, unknown10, flags, len(sections), root_section]
 	for section in sections:
-		header += struct.pack("<IBBHIII",
-			len(section.payload),
+		values += (
+			len(section.view),
 			section.typeid, # byte
 			section.unk5,   # byte
 			section.unk6,   # short
 			(len(section.fixup) << 8) | (section.subtypeid << 1),
 			section.s_id,
 			section.language)
+	struct.pack_into("<IIIIIIII" + "IBBHIII" * len(sections), buf, 0, *values)
+	cursor = 32 + len(sections)*20
+	buf[cursor:cursor+len(obj_dependency_list)] = obj_dependency_list
+	cursor += len(obj_dependency_list)
+	buf[cursor:cursor+len(drm_dependency_list)] = drm_dependency_list
 
-	header += obj_dependency_list
-	header += drm_dependency_list
+def write(obj_dependency_list, drm_dependency_list, unknown0C,
+	unknown10, flags, sections, root_section):
 
-	parts.append(header)
+	#obj_dependency_list = b"\0".join(obj_dependency_list)
+	#drm_dependency_list = b"\0".join(drm_dependency_list)
 
+	# every fixup and payload is copied exactly once, into a buffer sized
+	# from the precomputed layout. padding is already zero
+	header_size, offsets, size = write_layout(obj_dependency_list, drm_dependency_list, sections)
+	out = bytearray(size)
+	write_header_into(out, obj_dependency_list, drm_dependency_list,
+		unknown0C, unknown10, flags, sections, root_section)
+	for section, (fixup_offset, payload_offset) in zip(sections, offsets):
+		out[fixup_offset:fixup_offset+len(section.fixup)] = section.fixup
+		out[payload_offset:payload_offset+len(section.view)] = section.view
+	return out
+
+def write_to(f, obj_dependency_list, drm_dependency_list, unknown0C,
+	unknown10, flags, sections, root_section):
+	# like write, but straight into a file without building the drm in
+	# memory: only the header is packed, fixups and payloads go out as they are
+	header_size, offsets, size = write_layout(obj_dependency_list, drm_dependency_list, sections)
+	header = bytearray(header_size)
+	write_header_into(header, obj_dependency_list, drm_dependency_list,
+		unknown0C, unknown10, flags, sections, root_section)
+	parts = [header]
+	padding = bytes(16)
 	for section in sections:
 		parts.append(section.fixup)
-		parts.append(section.payload)
+		parts.append(padding[:(-len(section.fixup)) % 16])
+		parts.append(section.view)
+		parts.append(padding[:(-len(section.view)) % 16])
+	writev(f, parts)
+	return size
+
+def writev(f, parts):
+	# scatter write parts to a file object, with os.writev where possible
+	try:
+		fd = f.fileno() if hasattr(os, "writev") else None
+	except OSError:
+		fd = None
+	if fd is None:
+		for part in parts:
+			f.write(part)
+		return
+	f.flush()
+	parts = [memoryview(part).cast("B") for part in parts if len(part)]
+	i = 0
+	while i < len(parts):
+		written = os.writev(fd, parts[i:i+1024])
+		while written:
+			if written >= len(parts[i]):
+				written -= len(parts[i])
+				i += 1
+			else:
+				parts[i] = parts[i][written:]
+				written = 0
+	# let f pick up the position the writes moved the fd to, pipes and
+	# sockets don't have one
+	if f.seekable():
+		f.seek(0, os.SEEK_CUR)
+
+class Relocations(Mapping):
+	# read-only {patchsite: (kind, target, targetoff)} mapping, stored as
+	# parallel arrays sorted by patchsite instead of one tuple per entry.
+	# iterating follows the order of the fixup table, like the dict did
+	#
+	# target is a section index, or (targetty, targetid) for kind 2/4
+	# relocations pointing outside of the DRM; kinds has the missing bit
+	# set for those and targets then holds targetid. types is the
+	# targetty of every kind 2/4 relocation
+
+	missing = 0x80
+
+	def __init__(self, patchsites=(), kinds=(), targets=(), types=(), offsets=(), order=None):
+		self.patchsites = array.array("I", patchsites)
+		self.kinds = array.array("B", kinds)
+		self.targets = array.array("I", targets)
+		self.types = array.array("B", types)
+		self.offsets = array.array("I", offsets)
+		# rows in fixup table order, None when that is patchsite order
+		self.order = None if order is None else array.array("I", order)
+
+	@classmethod
+	def from_columns(cls, patchsites, kinds, targets, types, offsets):
+		# columns in fixup table order. when a patchsite appears more than
+		# once the last one wins but stays where the first one was (like it
+		# would in a dict)
+		first = {}
+		last = {}
+		for i, patchsite in enumerate(patchsites):
+			first.setdefault(patchsite, i)
+			last[patchsite] = i
+		keys = sorted(last)
+		rows = [last[patchsite] for patchsite in keys]
+		order = sorted(range(len(keys)), key=lambda j: first[keys[j]])
+		if all(i == j for i, j in enumerate(order)):
+			order = None
+		return cls(
+			keys,
+			[kinds[i] for i in rows],
+			[targets[i] for i in rows],
+			[types[i] for i in rows],
+			[offsets[i] for i in rows],
+			order)
+
+	def find(self, patchsite):
+		i = bisect_left(self.patchsites, patchsite)
+		if i < len(self.patchsites) and self.patchsites[i] == patchsite:
+			return i
+		return None
+
+	def row(self, i):
+		kind = self.kinds[i]
+		if kind & self.missing:
+			return (kind & ~self.missing, (self.types[i], self.targets[i]), self.offsets[i])
+		return (kind, self.targets[i], self.offsets[i])
+
+	def __getitem__(self, patchsite):
+		i = self.find(patchsite)
+		if i is None:
+			raise KeyError(patchsite)
+		return self.row(i)
+
+	def get(self, patchsite, default=None):
+		i = self.find(patchsite)
+		if i is None:
+			return default
+		return self.row(i)
+
+	def __contains__(self, patchsite):
+		return self.find(patchsite) is not None
+
+	def rows(self):
+		# row indices in fixup table order
+		if self.order is None:
+			return range(len(self.patchsites))
+		return self.order
+
+	def __iter__(self):
+		if self.order is None:
+			return iter(self.patchsites)
+		return (self.patchsites[i] for i in self.order)
+
+	def __len__(self):
+		return len(self.patchsites)
 
-	return pad16join(parts)
+	def items(self):
+		return ((self.patchsites[i], self.row(i)) for i in self.rows())
+
+	def values(self):
+		return (self.row(i) for i in self.rows())
+
+no_relocations = Relocations()
 
 def read_reloc(data, ty_id_to_index, current_section_index, current_section_payload, *, check=False):
 	if len(data) == 0:
-		return {}
+		return no_relocations
 
-	relocs = {}
 	f0, f1, f2, f3, f4 = struct.unpack("<IIIII", data[:20])
+	if numpy is not None:
+		relocs = read_reloc_numpy(data, f0, f1, f2, f4,
+			ty_id_to_index, current_section_index, current_section_payload)
+	else:
+		relocs = read_reloc_python(data, f0, f1, f2, f4,
+			ty_id_to_index, current_section_index, current_section_payload)
+
+	if check:
+		data2 = write_reloc(relocs, current_section_index)
+		assert data == data2
+
+	return relocs
+
+last_ty_id_table = None
+
+def ty_id_table(ty_id_to_index):
+	# ty_id_to_index as sorted (type << 32) | id keys and their section
+	# indices. all sections of a drm share one ty_id_to_index, so the last
+	# one is kept around
+	global last_ty_id_table
+	cached = last_ty_id_table
+	if cached is not None and cached[0] is ty_id_to_index and cached[1] == len(ty_id_to_index):
+		return cached[2], cached[3]
+	np = numpy
+	table = np.array([(ty << 32) | s_id for ty, s_id in ty_id_to_index], np.uint64)
+	indices = np.array(list(ty_id_to_index.values()), np.uint32)
+	order = np.argsort(table)
+	table = table[order]
+	indices = indices[order]
+	last_ty_id_table = ty_id_to_index, len(ty_id_to_index), table, indices
+	return table, indices
+
+def read_reloc_numpy(data, f0, f1, f2, f4, ty_id_to_index, current_section_index, current_section_payload):
+	# every relocation kind decoded with a few whole-array operations
+	np = numpy
+	c = 20
+	r0 = np.frombuffer(data, "<u8", f0, c); c += 8*f0
+	r1 = np.frombuffer(data, "<u8", f1, c); c += 8*f1
+	# wasn't there some difference between type 2 and 4
+	r24 = np.frombuffer(data, "<u4", f2 + f4, c)
+
+	# kind 2/4 only store type and patchsite, the id is at the patchsite
+	patchsites24 = (r24 & 0x01FFFFFF) * 4
+	types24 = (r24 >> 25).astype(np.uint8)
+	payload = np.frombuffer(current_section_payload, "<u4", len(current_section_payload) // 4)
+	ids24 = payload[patchsites24 // 4]
+
+	# look the (type, id) pairs up in a sorted copy of ty_id_to_index
+	table, table_indices = ty_id_table(ty_id_to_index)
+	keys24 = (types24.astype(np.uint64) << np.uint64(32)) | ids24.astype(np.uint64)
+	pos = np.searchsorted(table, keys24)
+	pos = np.minimum(pos, max(len(table) - 1, 0))
+	found = table[pos] == keys24 if len(table) else np.zeros(len(keys24), bool)
+	missing24 = ~found
+	targets24 = np.where(found, table_indices[pos] if len(table) else 0, ids24).astype(np.uint32)
+	kinds24 = np.repeat(np.array([2, 4], np.uint8), [f2, f4])
+	kinds24 |= missing24.astype(np.uint8) * Relocations.missing
+
+	# every piece cast before concatenating, mixing int64 and uint64 would
+	# go through float64
+	patchsites = np.concatenate((
+		(r0 & np.uint64(0xFFFFFFFF)).astype(np.uint32),
+		((r1 & np.uint64(0x0000003FFFFFC000)) >> np.uint64(12)).astype(np.uint32),
+		patchsites24.astype(np.uint32)))
+	kinds = np.concatenate((np.zeros(f0, np.uint8), np.ones(f1, np.uint8), kinds24))
+	targets = np.concatenate((
+		np.full(f0, current_section_index, np.uint32),
+		(r1 & np.uint64(0x3FFF)).astype(np.uint32),
+		targets24))
+	types = np.concatenate((np.zeros(f0 + f1, np.uint8), types24))
+	offsets = np.concatenate((
+		(r0 >> np.uint64(32)).astype(np.uint32),
+		(r1 >> np.uint64(38)).astype(np.uint32),
+		np.zeros(f2 + f4, np.uint32)))
+
+	# sort by patchsite, the last of several relocations for the same
+	# patchsite wins but keeps the place of the first like it would in a
+	# dict. order remembers the fixup table order of the rows
+	keys, first = np.unique(patchsites, return_index=True)
+	_, last = np.unique(patchsites[::-1], return_index=True)
+	rows = len(patchsites) - 1 - last
+	order = np.argsort(first, kind="stable")
+
+	def column(typecode, a):
+		out = array.array(typecode)
+		out.frombytes(a.astype(out.typecode).tobytes())
+		return out
+
+	relocs = Relocations()
+	relocs.patchsites = column("I", keys)
+	relocs.kinds = column("B", kinds[rows])
+	relocs.targets = column("I", targets[rows])
+	relocs.types = column("B", types[rows])
+	relocs.offsets = column("I", offsets[rows])
+	if (order != np.arange(len(order))).any():
+		relocs.order = column("I", order)
+	return relocs
+
+def read_reloc_python(data, f0, f1, f2, f4, ty_id_to_index, current_section_index, current_section_payload):
+	patchsites = []
+	kinds = []
+	targets = []
+	types = []
+	offsets = []
+
 	c = 20
 	for value in struct.iter_unpack("<Q", data[c:c+8*f0]):
 		value = value[0]
 		patchsite = (value & 0x00000000FFFFFFFF) >> 00
 		targetoff = (value & 0xFFFFFFFF00000000) >> 32
-		relocs[patchsite] = (0, current_section_index, targetoff)
+		patchsites.append(patchsite)
+		kinds.append(0)
+		targets.append(current_section_index)
+		types.append(0)
+		offsets.append(targetoff)
 		c+=8
 
 	for value in struct.iter_unpack("<Q", data[c:c+8*f1]):
@@ -425,84 +1301,178 @@ def read_reloc(data, ty_id_to_index, current_section_index, current_section_payl
 		targetidx = (value & 0x0000000000003FFF) >> 00
 		patchsite = (value & 0x0000003FFFFFC000) >> 12
 		targetoff = (value & 0xFFFFFFC000000000) >> 38
-		relocs[patchsite] = (1, targetidx, targetoff)
+		patchsites.append(patchsite)
+		kinds.append(1)
+		targets.append(targetidx)
+		types.append(0)
+		offsets.append(targetoff)
 		c+=8
 
-	for value in struct.iter_unpack("<I", data[c:c+4*f2]):
-		value = value[0]
-		patchsite = (value & 0x01FFFFFF)*4
-		targetty = value >> 25
-		targetid = struct.unpack("<I", current_section_payload[patchsite:patchsite+4])[0]
-		key = (targetty, targetid)
-		if key in ty_id_to_index:
-			relocs[patchsite] = (2, ty_id_to_index[key], 0)
-		else:
-			relocs[patchsite] = (2, key, 0)
-		c+=4
-
 	# wasn't there some difference between type 2 and 4
-	for value in struct.iter_unpack("<I", data[c:c+4*f4]):
-		value = value[0]
-		patchsite = (value & 0x01FFFFFF)*4
-		targetty = value >> 25
-		targetid = struct.unpack("<I", current_section_payload[patchsite:patchsite+4])[0]
-		key = (targetty, targetid)
-		if key in ty_id_to_index:
-			relocs[patchsite] = (4, ty_id_to_index[key], 0)
-		else:
-			relocs[patchsite] = (4, key, 0)
-		c+=4
-
-	if check:
-		data2 = write_reloc(relocs, current_section_index)
-		assert data == data2
+	for kind, count in ((2, f2), (4, f4)):
+		for value in struct.iter_unpack("<I", data[c:c+4*count]):
+			value = value[0]
+			patchsite = (value & 0x01FFFFFF)*4
+			targetty = value >> 25
+			targetid = struct.unpack("<I", current_section_payload[patchsite:patchsite+4])[0]
+			key = (targetty, targetid)
+			patchsites.append(patchsite)
+			if key in ty_id_to_index:
+				kinds.append(kind)
+				targets.append(ty_id_to_index[key])
+			else:
+				kinds.append(kind | Relocations.missing)
+				targets.append(targetid)
+			types.append(targetty)
+			offsets.append(0)
+			c+=4
 
-	return relocs
+	return Relocations.from_columns(patchsites, kinds, targets, types, offsets)
 
 def write_reloc(reloc, section_index):
+	# relocations grouped by kind and packed a whole kind at a time into
+	# one preallocated buffer. reloc is a Relocations, or any other
+	# {patchsite: (kind, target, targetoff)} mapping with (targetty,
+	# targetid) targets for kind 2/4
 	if not reloc:
 		return b""
 
-	r0 = b""
-	r1 = b""
-	r2 = b""
-	r4 = b""
+	if not isinstance(reloc, Relocations):
+		reloc = relocations_from_mapping(reloc)
+
+	# numpy only pays off past a few hundred relocations
+	if numpy is not None and len(reloc) >= 256:
+		r0, r1, r2, r4 = write_reloc_numpy(reloc)
+	else:
+		r0, r1, r2, r4 = write_reloc_python(reloc)
+
+	c = 20
+	out = bytearray(c + len(r0) + len(r1) + len(r2) + len(r4))
+	struct.pack_into("<IIIII", out, 0,
+		len(r0) // 8,
+		len(r1) // 8,
+		len(r2) // 4,
+		0,
+		len(r4) // 4)
+	for r in (r0, r1, r2, r4):
+		out[c:c+len(r)] = r
+		c += len(r)
+
+	return bytes(out)
+
+def relocations_from_mapping(reloc):
+	patchsites = []
+	kinds = []
+	targets = []
+	types = []
+	offsets = []
 	for patchsite, (ty, target, targetoff) in reloc.items():
-		if ty == 0:
-			assert patchsite <= 0xffffffff
-			assert targetoff <= 0xffffffff
+		if ty in (2, 4):
+			(targetty, targetid) = target
+			assert targetoff == 0
+			kinds.append(ty | Relocations.missing)
+			targets.append(targetid)
+			types.append(targetty)
+		else:
+			kinds.append(ty)
+			targets.append(target)
+			types.append(0)
+		patchsites.append(patchsite)
+		offsets.append(targetoff)
+	return Relocations.from_columns(patchsites, kinds, targets, types, offsets)
+
+def write_reloc_numpy(reloc):
+	np = numpy
+	kinds = np.frombuffer(reloc.kinds, np.uint8) & (0xFF ^ Relocations.missing)
+	patchsites = np.frombuffer(reloc.patchsites, np.uint32).astype(np.uint64)
+	targets = np.frombuffer(reloc.targets, np.uint32).astype(np.uint64)
+	types = np.frombuffer(reloc.types, np.uint8).astype(np.uint32)
+	offsets = np.frombuffer(reloc.offsets, np.uint32).astype(np.uint64)
+	if reloc.order is not None:
+		order = np.frombuffer(reloc.order, np.uint32)
+		kinds = kinds[order]
+		patchsites = patchsites[order]
+		targets = targets[order]
+		types = types[order]
+		offsets = offsets[order]
+
+	m = kinds == 0
+	r0 = patchsites[m] | (offsets[m] << np.uint64(32))
+
+	m = kinds == 1
+	assert (targets[m] <= 0x3FFF).all()
+	assert (patchsites[m] <= 0xFFFFFF).all()
+	assert (offsets[m] <= 0x3FFFFFF).all()
+	r1 = targets[m] | (patchsites[m] << np.uint64(12)) | (offsets[m] << np.uint64(38))
+
+	r24 = []
+	for kind in (2, 4):
+		m = kinds == kind
+		assert (offsets[m] == 0).all()
+		assert (patchsites[m] % 4 == 0).all()
+		assert (types[m] <= 0x7F).all()
+		assert (patchsites[m] >> np.uint64(2) <= 0x01FFFFFF).all()
+		r24.append((patchsites[m] >> np.uint64(2)).astype(np.uint32) | (types[m] << np.uint32(25)))
+
+	return (r0.astype("<u8").tobytes(), r1.astype("<u8").tobytes(),
+		r24[0].astype("<u4").tobytes(), r24[1].astype("<u4").tobytes())
+
+def write_reloc_python(reloc):
+	r = {0: [], 1: [], 2: [], 4: []}
+	for i in reloc.rows():
+		patchsite = reloc.patchsites[i]
+		kind = reloc.kinds[i] & ~Relocations.missing
+		target = reloc.targets[i]
+		targetty = reloc.types[i]
+		targetoff = reloc.offsets[i]
+		if kind == 0:
 			value = patchsite | (targetoff << 32)
-			r0 += struct.pack("<Q", value)
 
-		elif ty == 1:
+		elif kind == 1:
 			assert target <= 0x3FFF
 			assert patchsite <= 0xFFFFFF
 			assert targetoff <= 0x3FFFFFF
 			value = target | (patchsite << 12) | (targetoff << 38)
-			r1 += struct.pack("<Q", value)
 
-		elif ty in (2, 4):
-			(targetty, targetid) = target
+		elif kind in (2, 4):
 			assert targetoff == 0
 			assert patchsite % 4 == 0
 			assert targetty <= 0x7F
 			assert (patchsite >> 2) <= 0x01FFFFFF
 			value = (patchsite >> 2) | (targetty << 25)
-			if ty == 2:
-				r2 += struct.pack("<I", value)
-			else:
-				r4 += struct.pack("<I", value)
-
-	rawreloc = struct.pack("<IIIII",
-		len(r0) // 8,
-		len(r1) // 8,
-		len(r2) // 4,
-		0,
-		len(r4) // 4)
-
-	rawreloc += r0
-	rawreloc += r1
-	rawreloc += r2
-	rawreloc += r4
 
-	return rawreloc
+		else:
+			continue
+		r[kind].append(value)
+
+	def pack(typecode, values):
+		a = array.array(typecode, values)
+		if sys.byteorder != "little":
+			a.byteswap()
+		return a.tobytes()
+
+	return pack("Q", r[0]), pack("Q", r[1]), pack("I", r[2]), pack("I", r[4])
+
+def main():
+	import argparse
+	parser = argparse.ArgumentParser(description="DRM tools")
+	sub = parser.add_subparsers(dest="command", required=True)
+	p = sub.add_parser("index", help="write a section index for every .drm under basepath")
+	p.add_argument("basepath", help="eg. pc-w")
+	p.add_argument("indexpath")
+	p.add_argument("-j", "--workers", type=int, default=8)
+	args = parser.parse_args()
+
+	if args.command == "index":
+		fnames = []
+		for root, dirs, files in os.walk(args.basepath):
+			for fname in files:
+				if fname.endswith(".drm"):
+					fnames.append(os.path.relpath(os.path.join(root, fname), args.basepath))
+		fnames.sort()
+		db = DB(args.basepath)
+		db.create_index(args.indexpath, fnames, args.workers)
+		print(len(SectionIndex(args.indexpath)), "sections in", len(fnames), "files")
+
+if __name__ == '__main__':
+	main()
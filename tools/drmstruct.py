@@ -0,0 +1,231 @@
+import struct
+from collections import namedtuple
+
+import drm
+
+# declarative layouts for structs inside section payloads
+#
+#   admd = ADMD(unit.admd)        # view over a drm.Reference
+#   admd.imf_count                # one unpack_from per field
+#   admd.read()                   # all plain fields with a single unpack_from
+#   for imf in admd.imfs: ...     # array of structs, decoded in one pass
+#
+# accessors are compiled into a class per type when the type is declared
+
+uint32 = struct.Struct("<I").unpack_from
+
+class Field:
+	# plain value(s) at offset, fmt without byte order ("I", "16f", ...)
+	def __init__(self, offset, fmt):
+		self.offset = offset
+		self.fmt = fmt
+		self.size = struct.calcsize("<" + fmt)
+		self.count = len(struct.unpack("<" + fmt, bytes(self.size)))
+
+class Pointer:
+	# relocated pointer at offset, to is the StructType (or its name) of the
+	# target, or None for a plain drm.Reference
+	def __init__(self, offset, to=None):
+		self.offset = offset
+		self.to = to
+
+class Array(Pointer):
+	# pointer to count structs of type to, count is the name of a Field of
+	# the same struct, or None for the uint32 the engine keeps in front of
+	# the array
+	def __init__(self, offset, to, count=None, stride=None):
+		Pointer.__init__(self, offset, to)
+		self.count = count
+		self.stride = stride
+
+struct_types = {} # {name: StructType}
+
+class StructView:
+	__slots__ = ("ref", "values")
+
+	def __init__(self, ref, values=None):
+		self.ref = ref
+		self.values = values # tuple from StructType.struct when read in bulk
+
+	def read(self):
+		return self.type.read(self.ref)
+
+	def __repr__(self):
+		return "<{} {}>".format(self.type.name, self.ref)
+
+class StructType:
+	def __init__(self, type_name, type_size=None, **fields):
+		name = self.name = type_name
+		self.fields = fields
+
+		# every plain field in one struct, in offset order
+		plain = sorted((field.offset, fname) for fname, field in fields.items() if isinstance(field, Field))
+		fmt = "<"
+		cursor = 0
+		index = 0
+		positions = {}
+		for offset, fname in plain:
+			field = fields[fname]
+			assert offset >= cursor, "{}.{} overlaps the previous field".format(name, fname)
+			if offset > cursor:
+				fmt += "{}x".format(offset - cursor)
+			fmt += field.fmt
+			cursor = offset + field.size
+			positions[fname] = index if field.count == 1 else slice(index, index + field.count)
+			index += field.count
+		self.size = type_size or cursor
+		self.struct = struct.Struct(fmt)
+		self.strides = {}
+		self.record = namedtuple(name, [fname for offset, fname in plain])
+		self.positions = [positions[fname] for offset, fname in plain]
+
+		members = {"__slots__": (), "type": self}
+		for fname, field in fields.items():
+			if isinstance(field, Field):
+				members[fname] = field_property(field, positions[fname])
+			elif isinstance(field, Array):
+				members[fname] = array_property(field)
+			else:
+				members[fname] = pointer_property(field)
+		self.view = type(name, (StructView,), members)
+		struct_types[name] = self
+
+	def __call__(self, ref):
+		# view of the struct at ref, None stays None
+		if ref is None or isinstance(ref, drm.MissingReference):
+			return ref
+		return self.view(ref)
+
+	def unpack(self, values):
+		return self.record(*(values[position] for position in self.positions))
+
+	def read(self, ref):
+		return self.unpack(ref.access(self.struct.unpack_from))
+
+	def array(self, ref, count, stride=None):
+		# views of count structs starting at ref, with all their plain
+		# fields decoded by one iter_unpack over the payload
+		if ref is None or count == 0:
+			return []
+		stride = stride or self.size
+		s = self.strides.get(stride)
+		if s is None:
+			assert stride >= self.struct.size
+			s = self.strides[stride] = struct.Struct(self.struct.format + "{}x".format(stride - self.struct.size))
+		view = ref.section.view[ref.offset:ref.offset + count*stride]
+		return [
+			self.view(ref.add(i*stride), values)
+			for i, values in enumerate(s.iter_unpack(view))
+		]
+
+def resolve(to):
+	return struct_types[to] if isinstance(to, str) else to
+
+def field_property(field, position):
+	unpack_from = struct.Struct("<" + field.fmt).unpack_from
+	offset = field.offset
+	if field.count == 1:
+		def get(self):
+			if self.values is not None:
+				return self.values[position]
+			return unpack_from(self.ref.section.view, self.ref.offset + offset)[0]
+	else:
+		def get(self):
+			if self.values is not None:
+				return self.values[position]
+			return unpack_from(self.ref.section.view, self.ref.offset + offset)
+	return property(get)
+
+def pointer_property(field):
+	offset = field.offset
+	to = field.to
+	def get(self):
+		target = self.ref.deref(offset)
+		if to is None:
+			return target
+		return resolve(to)(target)
+	return property(get)
+
+def array_property(field):
+	offset = field.offset
+	count = field.count
+	def get(self):
+		target = self.ref.deref(offset)
+		if target is None or isinstance(target, drm.MissingReference):
+			return []
+		n = getattr(self, count) if count else target.access(uint32, -4)[0]
+		return resolve(field.to).array(target, n, field.stride)
+	return property(get)
+
+
+# scripts
+
+Decl = StructType("Decl", 0x14,
+	ty = Field(0x0, "B"),
+	count = Field(0x1, "B"),
+	nameid4 = Field(0x4, "H"),
+	nameid6 = Field(0x6, "H"),
+	tyext = Pointer(0x8),
+	member_offset = Field(0xC, "H"),
+	nameid14 = Field(0xE, "H"))
+
+FunctionSignature = StructType("FunctionSignature",
+	script_type = Pointer(0x0, "ScriptType"),
+	async_ = Field(0x5, "B"),
+	table_index = Field(0x6, "H"),
+	name8 = Field(0x8, "H"),
+	nameA = Field(0xA, "H"),
+	args = Array(0xC, Decl))
+
+Function = StructType("Function", 0x1C,
+	signature = Pointer(0x0, FunctionSignature),
+	local_inits = Pointer(0xC),
+	bytecode = Pointer(0x18))
+
+ScriptType = StructType("ScriptType",
+	version = Field(0x0, "I"),
+	path = Pointer(0xC),
+	name = Pointer(0x10),
+	parent = Pointer(0x18, "ScriptType"),
+	sizeof_members = Field(0x1C, "H"),
+	inits = Pointer(0x2C),
+	layout = Pointer(0x30),
+	functions = Array(0x38, Function))
+
+# units
+
+Terrain = StructType("Terrain",
+	rel_count = Field(0x2, "H"),
+	rel = Pointer(0x4),
+	cd0_count = Field(0x14, "I"),
+	cd0 = Pointer(0x18))
+
+IMFEntry = StructType("IMFEntry", 0x90,
+	matrix = Field(0x0, "16f"),
+	dtpid = Field(0x48, "I"),
+	path = Pointer(0x4C))
+
+ADMD = StructType("ADMD",
+	obj_count = Field(0x14, "I"),
+	objs = Pointer(0x18),
+	obj2_count = Field(0x1C, "I"),
+	imf_count = Field(0xA4, "I"),
+	imfs = Array(0xA8, IMFEntry, "imf_count"))
+
+Unit = StructType("Unit",
+	terrain = Pointer(0x0, Terrain),
+	admd = Pointer(0x30, ADMD),
+	cell_group_data = Pointer(0x50))
+
+# scenarios
+
+ScenarioEntry = StructType("ScenarioEntry", 0x8,
+	name = Pointer(0x0),
+	num4 = Field(0x4, "H"),
+	num6 = Field(0x6, "H"))
+
+Scenario = StructType("Scenario",
+	script_id = Field(0x0, "I"),
+	count_a = Field(0x4, "I"),
+	entries_a = Array(0x8, ScenarioEntry, "count_a"),
+	count_b = Field(0xC, "I"))
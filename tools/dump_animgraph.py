@@ -7,9 +7,6 @@ import drm
 with open(sys.argv[1], "rb") as f:
 	data = f.read()
 
-if data[0:4] == b"CDRM":
-	data = drm.cdrm(data)
-
 sections, root_index, _ = drm.read(data)
 
 def deref(ref, optoff = 0):
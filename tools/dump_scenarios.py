@@ -4,6 +4,7 @@ import array
 import sys
 
 import drm
+import drmstruct
 
 uint32 = struct.Struct("<I").unpack_from
 uint16 = struct.Struct("<H").unpack_from
@@ -18,21 +19,15 @@ def read_scenarios(db, scndb, scndb_root):
 
 	for scn_id in scn_ids:
 		#r = drm.Reference(scndb, db.index[7, scn_id][2])
-		r = db.lookup(7, scn_id)
-		script_id = r.access(uint32, 0)[0]
-		count_a = r.access(uint32, 4)[0]
-		entries_a = r.deref(8)
-		count_b = r.access(uint32, 12)[0]
+		scenario = drmstruct.Scenario(db.lookup(7, scn_id))
+		script_id, count_a, count_b = scenario.read()
 
 		lines = []
 
-		for ia in range(count_a):
-			entry_a = entries_a.add(ia*8)
-			name = entry_a.deref(0)
-			num4 = entry_a.access(uint16, 4)[0]
-			num6 = entry_a.access(uint16, 6)[0]
+		for entry_a in scenario.entries_a:
+			name = entry_a.name
 			name = name.access_null_terminated().decode("ascii") if name else "(unnamed)"
-			lines.append("{:04x} {:04x} {}".format(num4, num6, name))
+			lines.append("{:04x} {:04x} {}".format(entry_a.num4, entry_a.num6, name))
 		yield scn_id, count_a, count_b, lines
 
 if __name__ == '__main__':
@@ -15,6 +15,7 @@ r_dtp = r_obj.deref(0)
 r_data = r_dtp.deref(0xBC)
 n_scaleform_movies, = r_data.access(uint32, 0)
 r_dtp_movies = r_data.deref(4)
+base_patch = db.patch("globalscaleformdatabase.drm") # reuses the drm loaded above
 
 def build_patch(scale):
 	def focus(x, y):
@@ -81,8 +82,7 @@ def build_patch(scale):
 		# "scaleform\\OuterShell\\KeyboardMapper\\KeyboardMapper"
 	}
 
-	origdata = r_dtp_movies.section.payload
-	data = bytearray(origdata)
+	drm_patch = base_patch.copy()
 
 	for i in range(n_scaleform_movies):
 		r_dtp_movie = r_dtp_movies.add(0xC0*i)
@@ -94,22 +94,15 @@ def build_patch(scale):
 		newdim = patch.get(name, None)
 		if newdim is not None:
 			print("     {} {} {} {} -> {} {} {} {}".format(*(dim + newdim)))
-			dimbytes = struct.pack("<ffff", *newdim)
-			data[
-				r_dtp_movie.offset + 0x30:
-				r_dtp_movie.offset + 0x40] = dimbytes
+			drm_patch.pack(r_dtp_movie, "<ffff", 0x30, *newdim)
 
-	r_dtp_movies.section.payload = bytes(data)
-
-	modified_drm = extra.write(sections, rootsectionindex)
+	modified_drm = drm_patch.write()
 	fname = "scaleui_{}".format(scale).replace(".", "_") + ".000"
 	with open(fname, "wb") as f:
 		bigfile.write_bigfile(f, [
 			(b"pc-w\\globalscaleformdatabase.drm", 0xffffffff, modified_drm)
 		])
 
-	r_dtp_movies.section.payload = origdata
-
 
 build_patch(1.2)
 build_patch(1.5)